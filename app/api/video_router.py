@@ -1,4 +1,5 @@
 from fastapi import APIRouter, UploadFile, File, HTTPException, BackgroundTasks, Query
+from fastapi.concurrency import run_in_threadpool
 from fastapi.responses import JSONResponse
 from typing import Optional, List, Dict
 import shutil
@@ -29,8 +30,8 @@ async def upload_video(
         with file_path.open("wb") as buffer:
             shutil.copyfileobj(file.file, buffer)
         
-        # Create processing job
-        job_id = job_queue.create_job(str(file_path), {})
+        # Create processing job; probing the video runs off the event loop
+        job_id = await run_in_threadpool(job_queue.create_job, str(file_path), {})
         
         return JSONResponse({
             "message": "Video uploaded successfully",
@@ -44,7 +45,7 @@ async def upload_video(
 @router.post("/process")
 async def process_video(
     video_path: str,
-    style: Optional[str] = Query("cinematic", description="Style to apply (cinematic, vibrant, muted)"),
+    style: Optional[str] = Query("cinematic", description="Style to apply (cinematic, vibrant, muted, none)"),
     strength: Optional[float] = Query(0.5, ge=0.0, le=1.0, description="Strength of the style effect"),
     transitions: Optional[str] = Query("fade", description="Type of transition between scenes"),
     detect_scenes: Optional[bool] = Query(True, description="Whether to detect scenes automatically"),
@@ -54,9 +55,19 @@ async def process_video(
     min_importance_threshold: Optional[float] = Query(0.4, ge=0.0, le=1.0, description="Minimum importance threshold for scene selection"),
     analyze_motion: Optional[bool] = Query(True, description="Whether to analyze motion between frames"),
     analyze_continuity: Optional[bool] = Query(True, description="Whether to analyze scene continuity"),
-    min_object_continuity: Optional[float] = Query(0.5, ge=0.0, le=1.0, description="Minimum object continuity threshold for scene selection")
+    min_object_continuity: Optional[float] = Query(0.5, ge=0.0, le=1.0, description="Minimum object continuity threshold for scene selection"),
+    export_format: Optional[str] = Query(None, description="Export profile (youtube, instagram, tiktok); keeps the source format when omitted"),
+    export_formats: Optional[List[str]] = Query(None, description="Several export profiles, rendered in one pass to one file each"),
+    tenant_id: Optional[str] = Query(None, description="Tenant submitting the job, for fair scheduling between tenants")
 ):
     """Process a video with specified parameters."""
+    for name in [export_format] + (export_formats or []):
+        if name is not None and name not in settings.EXPORT_FORMATS:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Unknown export format: {name} (expected one of {', '.join(settings.EXPORT_FORMATS)})"
+            )
+    
     try:
         # Create processing parameters
         params = {
@@ -70,11 +81,13 @@ async def process_video(
             "min_importance_threshold": min_importance_threshold,
             "analyze_motion": analyze_motion,
             "analyze_continuity": analyze_continuity,
-            "min_object_continuity": min_object_continuity
+            "min_object_continuity": min_object_continuity,
+            "export_format": export_format,
+            "export_formats": export_formats
         }
         
-        # Create job
-        job_id = job_queue.create_job(video_path, params)
+        # Create job; probing the video runs off the event loop
+        job_id = await run_in_threadpool(job_queue.create_job, video_path, params, tenant_id)
         
         return JSONResponse({
             "message": "Video processing job created",
@@ -112,7 +125,8 @@ async def analyze_video(
     analyze_quality: Optional[bool] = Query(True, description="Whether to analyze scene quality"),
     analyze_motion: Optional[bool] = Query(True, description="Whether to analyze motion between frames"),
     analyze_continuity: Optional[bool] = Query(True, description="Whether to analyze scene continuity"),
-    num_keyframes: Optional[int] = Query(5, ge=1, le=20, description="Number of keyframes to extract")
+    num_keyframes: Optional[int] = Query(5, ge=1, le=20, description="Number of keyframes to extract"),
+    tenant_id: Optional[str] = Query(None, description="Tenant submitting the job, for fair scheduling between tenants")
 ) -> Dict:
     """Analyze a video without processing it."""
     try:
@@ -127,8 +141,8 @@ async def analyze_video(
             "analysis_only": True  # Flag to indicate this is an analysis-only job
         }
         
-        # Create job
-        job_id = job_queue.create_job(video_path, params)
+        # Create job; probing the video runs off the event loop
+        job_id = await run_in_threadpool(job_queue.create_job, video_path, params, tenant_id)
         
         return {
             "message": "Video analysis job created",
@@ -11,6 +11,7 @@ class Settings(BaseSettings):
     # File paths
     UPLOAD_DIR: Path = Path("uploads")
     OUTPUT_DIR: Path = Path("outputs")
+    TEMP_DIR: Optional[Path] = None  # per-job scratch space, e.g. /dev/shm for tmpfs; None uses the system default
     
     # Video processing settings
     MAX_VIDEO_SIZE: int = 500 * 1024 * 1024  # 500MB
@@ -18,8 +19,16 @@ class Settings(BaseSettings):
     DEFAULT_VIDEO_QUALITY: str = "high"
     
     # Scene detection settings
-    SCENE_DETECTION_THRESHOLD: float = 30.0
     MIN_SCENE_DURATION: float = 1.0  # seconds
+    SCENE_SIMILARITY_THRESHOLD: float = 0.5  # cosine similarity below which a new scene starts
+    SCENE_SAMPLE_RATE: float = 1.0  # sampled frames per second for scene detection
+    SCENE_ADAPTIVE_THRESHOLD: bool = False
+    SCENE_ADAPTIVE_WINDOW: int = 30  # previous samples used by the adaptive threshold
+    SCENE_ADAPTIVE_K: float = 3.0
+    SCENE_ADAPTIVE_MIN_SPREAD: float = 0.05
+    SCENE_PREFILTER: bool = True  # skip the deep model for samples nearly identical to the previous one
+    SCENE_PREFILTER_THRESHOLD: float = 0.08  # histogram/thumbnail change that triggers a deep comparison
+    SCENE_BUFFER_SIZE: int = 16  # frames sampled evenly across each scene for quality/importance analysis
     
     # Color grading presets
     COLOR_GRADING_PRESETS: dict = {
@@ -40,28 +49,95 @@ class Settings(BaseSettings):
         }
     }
     
+    STYLE_MODE: str = "lut"  # lut (3D LUT color grading) or neural (VGG feature-space styling)
+    LUT_BITS: int = 8  # per-channel LUT resolution; 8 is exact (64MB per preset), fewer bits band smooth gradients
+    LUT_CACHE_SIZE: int = 2  # compiled LUTs kept per process; the least recently used is dropped first
+    NEURAL_STYLE_RESOLUTION: int = 384  # long side of frames during neural styling
+    NEURAL_STYLE_BATCH_SIZE: int = 4  # frames per VGG pass
+    NEURAL_STYLE_STEPS: int = 10  # optimization steps to reconstruct the styled frames
+    NEURAL_STYLE_TILE_ROWS: int = 256  # full-resolution rows upsampled at a time
+    STYLE_REUSE_THRESHOLD: float = 0.004  # thumbnail difference (0-1) under which the last neural style transform is reused
+    
+    # Rendering settings
+    SEGMENTED_RENDER: bool = True  # render segments in parallel processes and join them with stream copy
+    RENDER_WORKERS: int = 0  # 0 uses one process per CPU core
+    RENDER_SEGMENT_SECONDS: float = 10.0  # longer scenes are split into several segments
+    STREAM_COPY_CUTS: bool = True  # cut-only jobs copy whole GOPs instead of re-encoding
+    RENDITION_QUEUE_SIZE: int = 8  # frames buffered per encoder when exporting several renditions
+    
     # Export settings
     EXPORT_FORMATS: dict = {
         "youtube": {
             "resolution": "1920x1080",
             "fps": 30,
-            "bitrate": "8000k"
+            "bitrate": "8000k",
+            "preset": "medium",
+            "crf": 20
         },
         "instagram": {
             "resolution": "1080x1920",
             "fps": 30,
-            "bitrate": "4000k"
+            "bitrate": "4000k",
+            "preset": "fast",
+            "crf": 23
         },
         "tiktok": {
             "resolution": "1080x1920",
             "fps": 30,
-            "bitrate": "4000k"
+            "bitrate": "4000k",
+            "preset": "fast",
+            "crf": 23
         }
     }
+    # Encoder defaults for formats that do not set them
+    EXPORT_PRESET: str = "medium"
+    EXPORT_CRF: Optional[int] = 23  # with a bitrate, the bitrate caps the constant-quality encode
+    EXPORT_THREADS: int = 0  # 0 lets the encoder pick, or splits the cores between segment renders
     
     # AI model settings
     USE_GPU: bool = True
+    FEATURE_BATCH_SIZE: int = 16  # frames per ResNet forward pass
+    FEATURE_HALF_PRECISION: bool = False  # float16 on GPU, bfloat16 on CPU
+    FEATURE_CHANNELS_LAST: bool = True
+    DETECTION_BATCH_SIZE: int = 8  # frames per YOLO forward pass
+    DETECTION_CONFIDENCE_THRESHOLD: float = 0.5
+    DETECTION_NMS_THRESHOLD: float = 0.4
+    DETECTION_INTERVAL: int = 5  # run YOLO every Nth frame, propagate with trackers in between
+    TRACKER_TYPE: str = "kcf"  # kcf, csrt (slower, steadier boxes) or mosse (fastest, loses targets easily)
+    TRACK_HISTORY_LENGTH: int = 32  # most recent positions kept per track
+    TRACK_MAX_LOST_FRAMES: int = 15  # lost tracks are forgotten after this many frames
     MODEL_CACHE_DIR: Optional[Path] = None
+    FEATURE_CACHE_MAX_BYTES: int = 2 * 1024 * 1024 * 1024  # 2GB of cached embeddings/detections
+    
+    # Job queue settings
+    REDIS_HOST: str = "localhost"
+    REDIS_PORT: int = 6379
+    REDIS_DB: int = 0
+    WORKER_PROCESSES: int = 1  # workers the API starts; 0 when they run separately with `python -m app.core.worker`
+    JOB_DEQUEUE_TIMEOUT: int = 5  # seconds a worker blocks waiting for a job before checking for shutdown
+    JOB_HEARTBEAT_INTERVAL: float = 10.0  # seconds between heartbeats of a running job
+    JOB_VISIBILITY_TIMEOUT: float = 120.0  # jobs without a heartbeat for this long are requeued
+    JOB_REAPER_INTERVAL: float = 30.0  # seconds between scans for stalled jobs
+    JOB_MAX_ATTEMPTS: int = 3  # jobs that stall this many times are failed instead of requeued
+    JOB_RETENTION_HOURS: int = 24  # finished jobs are removed from the indexes after this long
+    JOB_LANE_WEIGHTS: dict = {  # share of dequeues each lane gets while all of them have jobs
+        "analysis": 6,
+        "short": 3,
+        "long": 1
+    }
+    JOB_SHORT_VIDEO_SECONDS: float = 120.0  # longer videos go to the long lane
+    JOB_STAGE_COSTS: dict = {  # estimated processing seconds per second of video
+        "decode": 0.2,
+        "detect_scenes": 1.0,
+        "analyze_content": 0.5,
+        "analyze_motion": 0.5,
+        "color_grading": 0.5,
+        "export": 1.0
+    }
+    JOB_DEFAULT_DURATION: float = 60.0  # assumed video duration when it cannot be probed
+    JOB_COST_WEIGHT: float = 1.0  # seconds a job waits for each estimated second of work, so short jobs go first
+    JOB_TENANT_PENALTY: float = 60.0  # seconds added per job the same tenant queued within JOB_TENANT_WINDOW
+    JOB_TENANT_WINDOW: float = 3600.0
     
     class Config:
         env_file = ".env"
@@ -74,4 +150,6 @@ settings = Settings()
 settings.UPLOAD_DIR.mkdir(exist_ok=True)
 settings.OUTPUT_DIR.mkdir(exist_ok=True)
 if settings.MODEL_CACHE_DIR:
-    settings.MODEL_CACHE_DIR.mkdir(exist_ok=True) 
\ No newline at end of file
+    settings.MODEL_CACHE_DIR.mkdir(exist_ok=True)
+if settings.TEMP_DIR:
+    settings.TEMP_DIR.mkdir(parents=True, exist_ok=True) 
\ No newline at end of file
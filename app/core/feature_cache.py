@@ -0,0 +1,144 @@
+import hashlib
+import os
+import shutil
+import numpy as np
+from pathlib import Path
+from typing import Dict, List, Optional
+from app.core.config import settings
+
+class FeatureCache:
+    """On-disk cache for per-video model outputs.
+
+    Entries are keyed by the video's content hash and the model version and
+    live under MODEL_CACHE_DIR/features/<content_hash>/<model_version>/.
+    Arrays are stored as .npy files and loaded memory-mapped; individual
+    results are looked up by their (millisecond-rounded) sample timestamp.
+    The least recently used entries are evicted once the cache grows past
+    FEATURE_CACHE_MAX_BYTES.
+    """
+
+    def __init__(self, cache_dir: Optional[Path] = None, max_bytes: Optional[int] = None):
+        if cache_dir is None and settings.MODEL_CACHE_DIR is not None:
+            cache_dir = Path(settings.MODEL_CACHE_DIR) / "features"
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes if max_bytes is not None else settings.FEATURE_CACHE_MAX_BYTES
+
+    @property
+    def enabled(self) -> bool:
+        return self.cache_dir is not None
+
+    @staticmethod
+    def hash_file(path: str, chunk_size: int = 1024 * 1024) -> str:
+        """Hash the content of a file."""
+        digest = hashlib.blake2b(digest_size=16)
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(chunk_size), b""):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    @staticmethod
+    def timestamp_key(timestamp: float) -> float:
+        """Normalize a timestamp so that lookups are stable across decodes."""
+        return round(float(timestamp), 3)
+
+    def load_features(self, video_hash: str, model_version: str) -> Dict[float, np.ndarray]:
+        """Load cached feature vectors keyed by sample timestamp."""
+        entry = self._load_entry(video_hash, model_version, ("timestamps.npy", "features.npy"))
+        if entry is None:
+            return {}
+        timestamps, features = entry
+        return {self.timestamp_key(t): features[i] for i, t in enumerate(timestamps)}
+
+    def save_features(self, video_hash: str, model_version: str,
+                      timestamps: List[float], features: List[np.ndarray]):
+        """Store feature vectors for the given sample timestamps."""
+        if not self.enabled or not timestamps:
+            return
+        self._save_entry(video_hash, model_version, {
+            "timestamps.npy": np.asarray(timestamps, dtype=np.float64),
+            "features.npy": np.asarray(np.stack(features), dtype=np.float32)
+        })
+
+    def load_detections(self, video_hash: str, model_version: str) -> Dict[float, List[Dict]]:
+        """Load cached object detections keyed by frame timestamp."""
+        entry = self._load_entry(video_hash, model_version, ("detection_times.npy", "detections.npy"))
+        if entry is None:
+            return {}
+        frame_times, rows = entry
+
+        # Frames without detections are cached too, as empty lists
+        detections: Dict[float, List[Dict]] = {self.timestamp_key(t): [] for t in frame_times}
+        for t, x, y, w, h, confidence, class_id in rows:
+            detections[self.timestamp_key(t)].append({
+                "bbox": (int(x), int(y), int(w), int(h)),
+                "confidence": float(confidence),
+                "class_id": int(class_id)
+            })
+        return detections
+
+    def save_detections(self, video_hash: str, model_version: str, detections: Dict[float, List[Dict]]):
+        """Store object detections for every processed frame timestamp."""
+        if not self.enabled or not detections:
+            return
+        rows = [
+            (t, *detection["bbox"], detection["confidence"], detection["class_id"])
+            for t, frame_detections in detections.items()
+            for detection in frame_detections
+        ]
+        self._save_entry(video_hash, model_version, {
+            "detection_times.npy": np.asarray(list(detections.keys()), dtype=np.float64),
+            "detections.npy": np.asarray(rows, dtype=np.float64).reshape(-1, 7)
+        })
+
+    def _entry_dir(self, video_hash: str, model_version: str) -> Path:
+        return self.cache_dir / video_hash / model_version
+
+    def _load_entry(self, video_hash: str, model_version: str, names: tuple) -> Optional[tuple]:
+        if not self.enabled or not video_hash:
+            return None
+        entry_dir = self._entry_dir(video_hash, model_version)
+        try:
+            arrays = tuple(np.load(entry_dir / name, mmap_mode="r") for name in names)
+        except (OSError, ValueError):
+            return None
+
+        # Mark the entry as recently used for LRU eviction
+        os.utime(entry_dir)
+        return arrays
+
+    def _save_entry(self, video_hash: str, model_version: str, arrays: Dict[str, np.ndarray]):
+        entry_dir = self._entry_dir(video_hash, model_version)
+        entry_dir.mkdir(parents=True, exist_ok=True)
+
+        # Write to temporary files first so concurrent readers never see partial arrays
+        for name, array in arrays.items():
+            tmp_path = entry_dir / f".{name}.{os.getpid()}.tmp"
+            with open(tmp_path, "wb") as f:
+                np.save(f, array)
+            os.replace(tmp_path, entry_dir / name)
+        os.utime(entry_dir)
+
+        self._evict()
+
+    def _evict(self):
+        """Delete least recently used entries until the cache fits in max_bytes."""
+        entries = []
+        for entry_dir in self.cache_dir.glob("*/*"):
+            if entry_dir.is_dir():
+                size = sum(f.stat().st_size for f in entry_dir.iterdir() if f.is_file())
+                entries.append((entry_dir.stat().st_mtime, size, entry_dir))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, entry_dir in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            shutil.rmtree(entry_dir, ignore_errors=True)
+            total -= size
+
+        # Drop video directories that no longer hold any entry
+        for video_dir in self.cache_dir.iterdir():
+            if video_dir.is_dir() and not any(video_dir.iterdir()):
+                try:
+                    video_dir.rmdir()
+                except OSError:
+                    pass  # Another worker just added an entry
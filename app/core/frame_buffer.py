@@ -0,0 +1,51 @@
+import numpy as np
+from typing import Iterator, Optional
+
+class FrameSampleBuffer:
+    """Fixed-capacity buffer holding frames sampled evenly across a whole scene.
+
+    Every `stride`-th frame is kept. When the buffer fills up, every other
+    kept frame is dropped and the stride doubles, so the sample always
+    spans the scene from its first frame however long it runs, while
+    memory stays at `capacity` frames.
+    """
+
+    def __init__(self, capacity: int):
+        if capacity < 2:
+            raise ValueError("capacity must be at least 2")
+        self.capacity = capacity
+        self._frames: Optional[np.ndarray] = None
+        self._size = 0
+        self._seen = 0
+        self.stride = 1
+
+    def append(self, frame: np.ndarray):
+        """Offer the next frame of the scene, keeping it if it falls on the current stride."""
+        if self._frames is None or self._frames.shape[1:] != frame.shape or self._frames.dtype != frame.dtype:
+            self._frames = np.empty((self.capacity,) + frame.shape, dtype=frame.dtype)
+            self.clear()
+
+        if self._seen % self.stride == 0:
+            if self._size == self.capacity:
+                # Keep the frames on the doubled stride, in place
+                for i in range(0, self.capacity, 2):
+                    self._frames[i // 2] = self._frames[i]
+                self._size = (self.capacity + 1) // 2
+                self.stride *= 2
+            if self._seen % self.stride == 0:
+                self._frames[self._size] = frame
+                self._size += 1
+        self._seen += 1
+
+    def clear(self):
+        """Drop all frames but keep the allocated storage."""
+        self._size = 0
+        self._seen = 0
+        self.stride = 1
+
+    def __len__(self) -> int:
+        return self._size
+
+    def __iter__(self) -> Iterator[np.ndarray]:
+        for i in range(self._size):
+            yield self._frames[i]
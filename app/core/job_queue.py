@@ -1,11 +1,76 @@
 import redis
 import json
+import time
 import uuid
-from typing import Dict, Optional, List
+from typing import Dict, Optional, List, Tuple
 from datetime import datetime
 from app.core.config import settings
+from app.core.probe import probe_video
+
+# Sets fields of a job hash and refreshes its TTL in one step, unless the job has expired.
+# A status change also moves the job into the index set of its new status.
+# KEYS[1]: job hash; KEYS[2]: completion time index; KEYS[3], on a status change: index of
+# the new status; KEYS[4...]: indexes of the other statuses
+# ARGV[1]: TTL; ARGV[2]: field to increment, or ""; ARGV[3]: job ID;
+# ARGV[4]: completion timestamp, or ""; ARGV[5...]: field/value pairs
+UPDATE_JOB_SCRIPT = """
+if redis.call("EXISTS", KEYS[1]) == 0 then
+    return 0
+end
+if ARGV[2] ~= "" then
+    redis.call("HINCRBY", KEYS[1], ARGV[2], 1)
+end
+if #KEYS > 2 then
+    for i = 4, #KEYS do
+        redis.call("SREM", KEYS[i], ARGV[3])
+    end
+    redis.call("SADD", KEYS[3], ARGV[3])
+end
+if #ARGV > 4 then
+    redis.call("HSET", KEYS[1], unpack(ARGV, 5))
+end
+if ARGV[4] ~= "" then
+    redis.call("ZADD", KEYS[2], ARGV[4], ARGV[3])
+end
+redis.call("EXPIRE", KEYS[1], ARGV[1])
+return 1
+"""
+
+# Pops the job with the lowest score from the first non-empty lane onto the worker's list,
+# recording its owner and first heartbeat in the same step so a crash cannot orphan it.
+# Wake-ups beyond the number of jobs still queued are dropped, so they never pile up.
+# KEYS[1]: worker processing list; KEYS[2]: job owners; KEYS[3]: heartbeats; KEYS[4]: wake-ups;
+# KEYS[5...]: lane queues, in the order to try them
+# ARGV[1]: worker ID; ARGV[2]: current time
+DEQUEUE_JOB_SCRIPT = """
+for i = 5, #KEYS do
+    local popped = redis.call("ZPOPMIN", KEYS[i])
+    if popped[1] then
+        redis.call("RPUSH", KEYS[1], popped[1])
+        redis.call("HSET", KEYS[2], popped[1], ARGV[1])
+        redis.call("ZADD", KEYS[3], ARGV[2], popped[1])
+        local queued = 0
+        for j = 5, #KEYS do
+            queued = queued + redis.call("ZCARD", KEYS[j])
+        end
+        if queued == 0 then
+            redis.call("DEL", KEYS[4])
+        else
+            redis.call("LTRIM", KEYS[4], -queued, -1)
+        end
+        return {popped[1], KEYS[i]}
+    end
+end
+return false
+"""
 
 class JobQueue:
+    STATUSES = ("pending", "processing", "completed", "failed")
+    # Job hash fields that are not stored as plain strings
+    JSON_FIELDS = ("params", "details")
+    INT_FIELDS = ("attempts",)
+    FLOAT_FIELDS = ("progress", "cost", "priority")
+    
     def __init__(self):
         self.redis_client = redis.Redis(
             host=settings.REDIS_HOST,
@@ -13,15 +78,105 @@ class JobQueue:
             db=settings.REDIS_DB,
             decode_responses=True
         )
-        self.processing_queue = "video_processing_queue"
+        self.update_script = self.redis_client.register_script(UPDATE_JOB_SCRIPT)
+        self.dequeue_script = self.redis_client.register_script(DEQUEUE_JOB_SCRIPT)
+        # One sorted set per lane, scored so that cheap and long-waiting jobs come first
+        self.lane_prefix = "video_processing_queue:lane:"
+        self.notify_key = "video_processing_queue:notify"
+        self.tenant_prefix = "video_processing_queue:tenant:"
+        self.lane_credits: Dict[str, float] = {}
+        # Jobs a worker has taken stay on its processing list until acknowledged
+        self.worker_queue_prefix = "video_processing_queue:worker:"
+        self.workers_key = "video_processing_workers"
+        self.job_workers_key = "video_processing_job_workers"
+        self.heartbeats_key = "video_processing_heartbeats"
         self.job_status_prefix = "job_status:"
         self.job_progress_prefix = "job_progress:"
         self.job_result_prefix = "job_result:"
+        # Indexes maintained on every state change, so listing jobs never scans the keyspace
+        self.status_index_prefix = "jobs_by_status:"
+        self.completed_index = "jobs_by_completion_time"
         self.job_timeout = 3600  # 1 hour timeout
     
-    def create_job(self, video_path: str, params: Dict) -> str:
-        """Create a new video processing job."""
+    def _encode_fields(self, fields: Dict) -> Dict[str, str]:
+        return {
+            key: json.dumps(value) if key in self.JSON_FIELDS else str(value)
+            for key, value in fields.items()
+        }
+    
+    def _decode_fields(self, fields: Dict[str, str]) -> Dict:
+        job_data = dict(fields)
+        for key in self.JSON_FIELDS:
+            if key in job_data:
+                job_data[key] = json.loads(job_data[key])
+        for key in self.INT_FIELDS:
+            if key in job_data:
+                job_data[key] = int(job_data[key])
+        for key in self.FLOAT_FIELDS:
+            if key in job_data:
+                job_data[key] = float(job_data[key])
+        return job_data
+    
+    def _update_job(self, job_id: str, fields: Dict, increment: Optional[str] = None,
+                    completed: bool = False, client=None):
+        """Atomically set fields of an existing job; returns whether it exists (or queues the update on a pipeline)."""
+        args = [self.job_timeout, increment or "", job_id, time.time() if completed else ""]
+        for key, value in self._encode_fields(fields).items():
+            args += [key, value]
+        keys = [f"{self.job_status_prefix}{job_id}", self.completed_index]
+        if "status" in fields:
+            # Every index key the script touches is declared, as Redis Cluster requires
+            keys.append(f"{self.status_index_prefix}{fields['status']}")
+            keys += [f"{self.status_index_prefix}{status}" for status in self.STATUSES if status != fields["status"]]
+        return self.update_script(keys=keys, args=args, client=client if client is not None else self.redis_client)
+    
+    def estimate_job(self, video_path: str, params: Dict) -> Tuple[str, float]:
+        """Lane and estimated processing seconds of a job, from the video duration and requested stages."""
+        try:
+            duration = probe_video(video_path)["duration"]
+        except OSError:
+            duration = None
+        if not duration:
+            duration = settings.JOB_DEFAULT_DURATION
+        
+        analysis_only = params.get("analysis_only", False)
+        stages = ["decode"]
+        stages += [stage for stage in ("detect_scenes", "analyze_content", "analyze_motion") if params.get(stage, True)]
+        if not analysis_only:
+            if params.get("style", "cinematic") not in (None, "none") and params.get("strength", 0.5) > 0:
+                stages.append("color_grading")
+            stages.append("export")
+        cost = duration * sum(settings.JOB_STAGE_COSTS.get(stage, 0.0) for stage in stages)
+        
+        if analysis_only:
+            lane = "analysis"
+        elif duration <= settings.JOB_SHORT_VIDEO_SECONDS:
+            lane = "short"
+        else:
+            lane = "long"
+        return lane, cost
+    
+    def _tenant_penalty(self, tenant_id: Optional[str], job_id: str, now: float) -> float:
+        """Priority penalty for the tenant's recent jobs; also records this one."""
+        if not tenant_id:
+            return 0.0
+        key = f"{self.tenant_prefix}{tenant_id}"
+        pipe = self.redis_client.pipeline()
+        pipe.zremrangebyscore(key, "-inf", now - settings.JOB_TENANT_WINDOW)
+        pipe.zcard(key)
+        pipe.zadd(key, {job_id: now})
+        pipe.expire(key, int(settings.JOB_TENANT_WINDOW))
+        recent = pipe.execute()[1]
+        return recent * settings.JOB_TENANT_PENALTY
+    
+    def create_job(self, video_path: str, params: Dict, tenant_id: Optional[str] = None) -> str:
+        """Create a new video processing job in the lane matching its estimated cost."""
         job_id = str(uuid.uuid4())
+        lane, cost = self.estimate_job(video_path, params)
+        now = time.time()
+        # Jobs are ordered by enqueue time pushed back by their cost, so short jobs overtake
+        # long ones but every job eventually reaches the front
+        priority = now + cost * settings.JOB_COST_WEIGHT + self._tenant_penalty(tenant_id, job_id, now)
         job_data = {
             "id": job_id,
             "video_path": video_path,
@@ -29,78 +184,68 @@ class JobQueue:
             "status": "pending",
             "created_at": datetime.utcnow().isoformat(),
             "progress": 0,
-            "current_stage": "initializing"
+            "current_stage": "initializing",
+            "attempts": 0,
+            "lane": lane,
+            "cost": round(cost, 3),
+            "priority": priority
         }
+        if tenant_id:
+            job_data["tenant_id"] = tenant_id
         
-        # Store job data
-        self.redis_client.setex(
-            f"{self.job_status_prefix}{job_id}",
-            self.job_timeout,
-            json.dumps(job_data)
-        )
-        
-        # Add to processing queue
-        self.redis_client.rpush(self.processing_queue, job_id)
+        # Store job data and add it to its lane in one transaction
+        key = f"{self.job_status_prefix}{job_id}"
+        pipe = self.redis_client.pipeline()
+        pipe.hset(key, mapping=self._encode_fields(job_data))
+        pipe.expire(key, self.job_timeout)
+        pipe.sadd(f"{self.status_index_prefix}pending", job_id)
+        self._enqueue(job_id, lane, priority, pipe)
+        pipe.execute()
         
         return job_id
     
+    def _enqueue(self, job_id: str, lane: str, priority: float, pipe):
+        """Queue a job on a lane and wake up one waiting worker."""
+        pipe.zadd(f"{self.lane_prefix}{lane}", {job_id: priority})
+        pipe.rpush(self.notify_key, job_id)
+    
     def get_job_status(self, job_id: str) -> Optional[Dict]:
         """Get the current status of a job."""
-        job_data = self.redis_client.get(f"{self.job_status_prefix}{job_id}")
+        job_data = self.redis_client.hgetall(f"{self.job_status_prefix}{job_id}")
         if job_data:
-            return json.loads(job_data)
+            return self._decode_fields(job_data)
         return None
     
     def update_job_progress(self, job_id: str, progress: float, stage: str, details: Optional[Dict] = None):
         """Update the progress of a job."""
-        job_data = self.get_job_status(job_id)
-        if job_data:
-            job_data["progress"] = progress
-            job_data["current_stage"] = stage
-            if details:
-                job_data["details"] = details
-            
-            self.redis_client.setex(
-                f"{self.job_status_prefix}{job_id}",
-                self.job_timeout,
-                json.dumps(job_data)
-            )
+        fields = {"progress": progress, "current_stage": stage}
+        if details:
+            fields["details"] = details
+        self._update_job(job_id, fields)
     
     def complete_job(self, job_id: str, result: Dict):
         """Mark a job as completed and store its result."""
-        job_data = self.get_job_status(job_id)
-        if job_data:
-            job_data["status"] = "completed"
-            job_data["completed_at"] = datetime.utcnow().isoformat()
-            job_data["progress"] = 100
-            
-            # Store final status
-            self.redis_client.setex(
-                f"{self.job_status_prefix}{job_id}",
-                self.job_timeout,
-                json.dumps(job_data)
-            )
-            
-            # Store result
-            self.redis_client.setex(
-                f"{self.job_result_prefix}{job_id}",
-                self.job_timeout,
-                json.dumps(result)
-            )
+        # Status and result are written together, so readers never see one without the other
+        pipe = self.redis_client.pipeline()
+        self._update_job(job_id, {
+            "status": "completed",
+            "completed_at": datetime.utcnow().isoformat(),
+            "progress": 100
+        }, completed=True, client=pipe)
+        pipe.setex(
+            f"{self.job_result_prefix}{job_id}",
+            self.job_timeout,
+            json.dumps(result)
+        )
+        pipe.execute()
     
     def fail_job(self, job_id: str, error: str):
         """Mark a job as failed."""
-        job_data = self.get_job_status(job_id)
-        if job_data:
-            job_data["status"] = "failed"
-            job_data["error"] = error
-            job_data["completed_at"] = datetime.utcnow().isoformat()
-            
-            self.redis_client.setex(
-                f"{self.job_status_prefix}{job_id}",
-                self.job_timeout,
-                json.dumps(job_data)
-            )
+        self._update_job(job_id, {
+            "status": "failed",
+            "error": error,
+            "completed_at": datetime.utcnow().isoformat()
+        }, completed=True)
     
     def get_job_result(self, job_id: str) -> Optional[Dict]:
         """Get the result of a completed job."""
@@ -109,32 +254,164 @@ class JobQueue:
             return json.loads(result)
         return None
     
-    def get_next_job(self) -> Optional[str]:
-        """Get the next job ID from the queue."""
-        return self.redis_client.lpop(self.processing_queue)
+    def get_next_job(self, worker_id: str, timeout: Optional[int] = None) -> Optional[str]:
+        """Wait for the next job ID and move it onto the worker's processing list.
+        
+        Lanes are served by smooth weighted round robin over JOB_LANE_WEIGHTS,
+        so every lane with jobs gets its share of dequeues. The job stays on
+        the processing list until ack_job, so a crashed worker's jobs can be
+        requeued by requeue_stalled_jobs.
+        """
+        if timeout is None:
+            timeout = settings.JOB_DEQUEUE_TIMEOUT
+        self.redis_client.sadd(self.workers_key, worker_id)
+        
+        deadline = time.monotonic() + timeout
+        while True:
+            job_id = self._pop_job(worker_id)
+            remaining = deadline - time.monotonic()
+            if job_id or remaining <= 0:
+                return job_id
+            # Sleep until a job is queued; a wake-up may find the job taken by another worker
+            self.redis_client.blpop(self.notify_key, timeout=remaining)
+    
+    def _pop_job(self, worker_id: str) -> Optional[str]:
+        """Pop one job, trying the lane that is owed the most dequeues first."""
+        weights = settings.JOB_LANE_WEIGHTS
+        lanes = sorted(weights, key=lambda lane: self.lane_credits.get(lane, 0.0) + weights[lane], reverse=True)
+        keys = [f"{self.worker_queue_prefix}{worker_id}", self.job_workers_key, self.heartbeats_key, self.notify_key]
+        popped = self.dequeue_script(keys=keys + [f"{self.lane_prefix}{lane}" for lane in lanes],
+                                     args=[worker_id, time.time()], client=self.redis_client)
+        if not popped:
+            return None
+        job_id, lane_key = popped
+        
+        served = lane_key[len(self.lane_prefix):]
+        total = sum(weights.values())
+        for lane, weight in weights.items():
+            credit = self.lane_credits.get(lane, 0.0) + weight - (total if lane == served else 0.0)
+            # Idle lanes bank at most one round of credit, so a burst cannot starve the other lanes
+            self.lane_credits[lane] = min(max(credit, -total), total)
+        return job_id
+    
+    def start_job(self, job_id: str, worker_id: str) -> Optional[Dict]:
+        """Mark a dequeued job as processing and count the attempt; returns the job data."""
+        pipe = self.redis_client.pipeline()
+        self._update_job(job_id, {
+            "status": "processing",
+            "worker_id": worker_id,
+            "started_at": datetime.utcnow().isoformat()
+        }, increment="attempts", client=pipe)
+        pipe.hgetall(f"{self.job_status_prefix}{job_id}")
+        _, job_data = pipe.execute()
+        return self._decode_fields(job_data) if job_data else None
+    
+    def heartbeat(self, job_id: str):
+        """Record that a job is still being worked on."""
+        self.redis_client.zadd(self.heartbeats_key, {job_id: time.time()}, xx=True)
+    
+    def ack_job(self, job_id: str, worker_id: str):
+        """Remove a finished (completed or failed) job from the worker's processing list."""
+        pipe = self.redis_client.pipeline()
+        pipe.lrem(f"{self.worker_queue_prefix}{worker_id}", 1, job_id)
+        pipe.zrem(self.heartbeats_key, job_id)
+        pipe.hdel(self.job_workers_key, job_id)
+        pipe.execute()
+    
+    def requeue_stalled_jobs(self, visibility_timeout: Optional[float] = None) -> List[str]:
+        """Put jobs whose heartbeat stopped back at the front of the queue.
+        
+        Jobs that already stalled JOB_MAX_ATTEMPTS times are failed instead.
+        Returns the requeued job IDs.
+        """
+        if visibility_timeout is None:
+            visibility_timeout = settings.JOB_VISIBILITY_TIMEOUT
+        now = time.time()
+        
+        # Jobs on a processing list without a heartbeat start their timeout now; the list
+        # they are on also tells whose they are, should their owner entry be missing
+        listed_owners = {}
+        for worker_id in self.redis_client.smembers(self.workers_key):
+            worker_queue = f"{self.worker_queue_prefix}{worker_id}"
+            job_ids = self.redis_client.lrange(worker_queue, 0, -1)
+            if job_ids:
+                self.redis_client.zadd(self.heartbeats_key, {job_id: now for job_id in job_ids}, nx=True)
+                listed_owners.update((job_id, worker_id) for job_id in job_ids)
+            else:
+                self.redis_client.srem(self.workers_key, worker_id)
+        
+        requeued = []
+        for job_id in self.redis_client.zrangebyscore(self.heartbeats_key, 0, now - visibility_timeout):
+            worker_id = self.redis_client.hget(self.job_workers_key, job_id) or listed_owners.get(job_id)
+            worker_queue = f"{self.worker_queue_prefix}{worker_id}"
+            job_data = self.get_job_status(job_id)
+            # Expired jobs are dropped, jobs that keep stalling are failed
+            exhausted = job_data is None or job_data.get("attempts", 0) >= settings.JOB_MAX_ATTEMPTS
+            with self.redis_client.pipeline() as pipe:
+                try:
+                    # Another reaper or the worker itself may get to the job first
+                    pipe.watch(worker_queue, self.heartbeats_key)
+                    score = pipe.zscore(self.heartbeats_key, job_id)
+                    if score is None or score > now - visibility_timeout:
+                        continue
+                    taken = worker_id is not None and pipe.lpos(worker_queue, job_id) is not None
+                    pipe.multi()
+                    pipe.zrem(self.heartbeats_key, job_id)
+                    pipe.hdel(self.job_workers_key, job_id)
+                    if taken:
+                        pipe.lrem(worker_queue, 1, job_id)
+                        if not exhausted:
+                            # Keep the original priority, so the job goes back near the front of its lane
+                            self._update_job(job_id, {"status": "pending", "current_stage": "requeued"}, client=pipe)
+                            self._enqueue(job_id, job_data.get("lane", "long"), job_data.get("priority", 0.0), pipe)
+                    pipe.execute()
+                except redis.WatchError:
+                    continue
+            
+            if not taken:
+                continue
+            if not exhausted:
+                requeued.append(job_id)
+            elif job_data is not None:
+                self.fail_job(job_id, f"Job stalled {job_data['attempts']} times without a heartbeat")
+        return requeued
     
     def get_active_jobs(self) -> List[Dict]:
         """Get all active jobs (pending or processing)."""
-        active_jobs = []
-        for key in self.redis_client.keys(f"{self.job_status_prefix}*"):
-            job_data = self.redis_client.get(key)
+        job_ids = list(self.redis_client.sunion(f"{self.status_index_prefix}pending",
+                                                f"{self.status_index_prefix}processing"))
+        pipe = self.redis_client.pipeline(transaction=False)
+        for job_id in job_ids:
+            pipe.hgetall(f"{self.job_status_prefix}{job_id}")
+        
+        active_jobs, expired = [], []
+        for job_id, job_data in zip(job_ids, pipe.execute()):
             if job_data:
-                job = json.loads(job_data)
-                if job["status"] in ["pending", "processing"]:
-                    active_jobs.append(job)
+                active_jobs.append(self._decode_fields(job_data))
+            else:
+                expired.append(job_id)
+        
+        # Jobs that expired while active leave stale index entries behind
+        if expired:
+            pipe = self.redis_client.pipeline(transaction=False)
+            pipe.srem(f"{self.status_index_prefix}pending", *expired)
+            pipe.srem(f"{self.status_index_prefix}processing", *expired)
+            pipe.execute()
         return active_jobs
     
-    def cleanup_old_jobs(self, max_age_hours: int = 24):
-        """Clean up old completed or failed jobs."""
-        now = datetime.utcnow()
-        for key in self.redis_client.keys(f"{self.job_status_prefix}*"):
-            job_data = self.redis_client.get(key)
-            if job_data:
-                job = json.loads(job_data)
-                if job["status"] in ["completed", "failed"]:
-                    completed_at = datetime.fromisoformat(job["completed_at"])
-                    age = (now - completed_at).total_seconds() / 3600
-                    if age > max_age_hours:
-                        job_id = job["id"]
-                        self.redis_client.delete(f"{self.job_status_prefix}{job_id}")
-                        self.redis_client.delete(f"{self.job_result_prefix}{job_id}") 
\ No newline at end of file
+    def cleanup_old_jobs(self, max_age_hours: int = 24, batch_size: int = 500) -> int:
+        """Clean up old completed or failed jobs, in batches; returns how many were removed."""
+        cutoff = time.time() - max_age_hours * 3600
+        removed = 0
+        while True:
+            job_ids = self.redis_client.zrangebyscore(self.completed_index, "-inf", cutoff, start=0, num=batch_size)
+            if not job_ids:
+                return removed
+            pipe = self.redis_client.pipeline(transaction=False)
+            pipe.delete(*(f"{self.job_status_prefix}{job_id}" for job_id in job_ids))
+            pipe.delete(*(f"{self.job_result_prefix}{job_id}" for job_id in job_ids))
+            pipe.srem(f"{self.status_index_prefix}completed", *job_ids)
+            pipe.srem(f"{self.status_index_prefix}failed", *job_ids)
+            pipe.zrem(self.completed_index, *job_ids)
+            pipe.execute()
+            removed += len(job_ids)
@@ -0,0 +1,31 @@
+import os
+import re
+import subprocess
+from typing import Dict
+
+def ffmpeg_binary() -> str:
+    """The ffmpeg binary moviepy would use, found without importing moviepy."""
+    binary = os.environ.get("FFMPEG_BINARY", "ffmpeg-imageio")
+    if binary == "ffmpeg-imageio":
+        from imageio_ffmpeg import get_ffmpeg_exe
+        return get_ffmpeg_exe()
+    if binary == "auto-detect":
+        return "ffmpeg"
+    return binary
+
+def probe_video(video_path: str) -> Dict:
+    """Codecs of the first video and audio streams and the duration of a file."""
+    # ffmpeg exits with an error when no output is given, but still describes the input
+    command = [ffmpeg_binary(), "-hide_banner", "-i", str(video_path)]
+    log = subprocess.run(command, capture_output=True, text=True).stderr
+    video = re.search(r"Stream #\S+.*?: Video: (\w+)", log)
+    audio = re.search(r"Stream #\S+.*?: Audio: (\w+)", log)
+    duration = re.search(r"Duration: (\d+):(\d+):([\d.]+)", log)
+    fps = re.search(r"Stream #\S+.*?: Video: .*?([\d.]+) fps", log)
+    return {
+        "video_codec": video.group(1) if video else None,
+        "fps": float(fps.group(1)) if fps else None,
+        "audio_codec": audio.group(1) if audio else None,
+        "duration": (int(duration.group(1)) * 3600 + int(duration.group(2)) * 60 +
+                     float(duration.group(3))) if duration else None
+    }
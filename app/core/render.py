@@ -0,0 +1,392 @@
+import multiprocessing
+import os
+import queue
+import re
+import subprocess
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+from moviepy.config import get_setting
+from moviepy.editor import VideoClip, VideoFileClip
+from moviepy.video.io.ffmpeg_writer import FFMPEG_VideoWriter
+from app.core.config import settings
+from app.core.probe import probe_video
+from app.core.style_cache import TemporalStyleCache
+from app.models.style_transfer import StyleTransfer
+
+# Styling model of the current render worker process, created on first use
+_style_transfer: Optional[StyleTransfer] = None
+
+# Cut points closer than this to a keyframe are treated as on it
+KEYFRAME_TOLERANCE = 1e-3
+
+# Audio codecs the mp4 muxer accepts as they are
+COPYABLE_AUDIO_CODECS = ("aac", "mp3", "alac", "ac3")
+
+def run_ffmpeg(args: List[str], loglevel: str = "error") -> str:
+    """Run the ffmpeg binary used by moviepy, raising on failure; returns its log."""
+    command = [get_setting("FFMPEG_BINARY"), "-hide_banner", "-nostats", "-loglevel", loglevel, "-y", *args]
+    result = subprocess.run(command, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"ffmpeg failed: {result.stderr.strip()}")
+    return result.stderr
+
+def can_stream_copy(probe: Dict) -> bool:
+    """Whether smart_cut can join copied pieces of this file with re-encoded ones."""
+    return probe["video_codec"] == "h264" and probe["duration"] is not None and probe["fps"] is not None
+
+def keyframe_times(video_path: str) -> List[float]:
+    """Timestamps of the video's keyframes, decoding only the keyframes."""
+    log = run_ffmpeg(["-skip_frame", "nokey", "-i", str(video_path), "-an", "-vf", "showinfo",
+                      "-f", "null", "-"], loglevel="info")
+    return sorted(float(t) for t in re.findall(r"pts_time:([\d.]+)", log))
+
+def plan_smart_cut(start: float, end: float, keyframes: List[float],
+                   duration: float) -> List[Tuple[float, float, bool]]:
+    """Split a time range into (start, end, copy) pieces.
+    
+    The part between the first and last keyframes inside the range is
+    stream-copied; only the partial GOPs at its edges are re-encoded.
+    """
+    inside = [k for k in keyframes if start - KEYFRAME_TOLERANCE <= k <= end + KEYFRAME_TOLERANCE]
+    if not inside:
+        return [(start, end, False)]
+    
+    copy_start = inside[0] if inside[0] > start + KEYFRAME_TOLERANCE else start
+    # A range running to the end of the video can be copied up to its end
+    copy_end = end if end >= duration - KEYFRAME_TOLERANCE else inside[-1]
+    if copy_end <= copy_start + KEYFRAME_TOLERANCE:
+        return [(start, end, False)]
+    
+    pieces = []
+    if copy_start > start:
+        pieces.append((start, copy_start, False))
+    pieces.append((copy_start, copy_end, True))
+    if end > copy_end + KEYFRAME_TOLERANCE:
+        pieces.append((copy_end, end, False))
+    return pieces
+
+def frame_time(t: float, fps: float) -> float:
+    """Timestamp of the first source frame at or after t."""
+    return np.ceil(t * fps - KEYFRAME_TOLERANCE) / fps
+
+def frames_between(start: float, end: float, fps: float) -> int:
+    """Number of source frames whose timestamps fall in [start, end)."""
+    return int(round((frame_time(end, fps) - frame_time(start, fps)) * fps))
+
+def smart_cut(video_path: str, timeline: List[Tuple[float, float]], output_path: str,
+              work_dir: Path, duration: float, fps: float, has_audio: bool = True):
+    """Cut the time ranges out of an H.264 video, re-encoding only partial GOPs.
+    
+    Video pieces are joined with stream copy; the audio of all ranges is cut
+    in a single pass and muxed in as one continuous AAC track.
+    """
+    keyframes = keyframe_times(video_path)
+    
+    piece_paths = []
+    for start, end in timeline:
+        for piece_start, piece_end, copy in plan_smart_cut(start, end, keyframes, duration):
+            piece_path = str(Path(work_dir) / f"piece-{len(piece_paths):05d}.mp4")
+            # Re-encoded frames are retimed onto the frame grid from zero; left at their source
+            # offset, the constant frame rate output repeats the first frame and drops the last
+            codec_args = ["-c:v", "copy"] if copy else ["-c:v", "libx264", "-pix_fmt", "yuv420p",
+                                                        "-vf", "setpts=N/FRAME_RATE/TB"]
+            # Count frames rather than time: with stream copy, -t lets frames of the next GOP through
+            frames = max(1, frames_between(piece_start, piece_end, fps))
+            run_ffmpeg(["-ss", f"{piece_start:.6f}", "-i", str(video_path), "-frames:v", str(frames),
+                        "-an", *codec_args, "-avoid_negative_ts", "make_zero", piece_path])
+            piece_paths.append(piece_path)
+    
+    video_path_only = Path(work_dir) / "video.mp4"
+    concat_segments(piece_paths, str(video_path_only), work_dir)
+    
+    if not has_audio:
+        os.replace(video_path_only, output_path)
+        return
+    
+    # Cut the audio of every range at the frames kept from it
+    frame_timeline = [(frame_time(start, fps), frame_time(end, fps)) for start, end in timeline]
+    mux_timeline_audio(video_path, str(video_path_only), frame_timeline, output_path)
+
+def mux_timeline_audio(source_path: str, video_path: str, timeline: List[Tuple[float, float]], output_path: str):
+    """Add the source audio of the time ranges to a video-only file, as one continuous AAC track.
+    
+    All ranges are cut and joined in a single filter graph and encoded once,
+    so there are no encoder priming gaps at the joins.
+    """
+    trims = "".join(
+        f"[0:a]atrim={start:.6f}:{end:.6f},asetpts=PTS-STARTPTS[a{i}];" for i, (start, end) in enumerate(timeline)
+    )
+    joined = "".join(f"[a{i}]" for i in range(len(timeline)))
+    run_ffmpeg(["-i", str(source_path), "-i", str(video_path),
+                "-filter_complex", f"{trims}{joined}concat=n={len(timeline)}:v=0:a=1[audio]",
+                "-map", "1:v", "-map", "[audio]", "-c:v", "copy", "-c:a", "aac",
+                "-movflags", "+faststart", str(output_path)])
+
+def extract_audio(video_path: str, audio_path: str):
+    """Copy the first audio stream of a file into its own file, without re-encoding."""
+    run_ffmpeg(["-i", str(video_path), "-map", "0:a:0", "-vn", "-c:a", "copy", str(audio_path)])
+
+def mux_audio(video_path: str, audio_path: str, output_path: str):
+    """Combine a video-only file with an audio file, copying both streams."""
+    run_ffmpeg(["-i", str(video_path), "-i", str(audio_path), "-map", "0:v:0", "-map", "1:a:0",
+                "-c", "copy", "-movflags", "+faststart", str(output_path)])
+
+def concat_segments(segment_paths: List[str], output_path: str, work_dir: Path):
+    """Join encoded segments with the concat demuxer, without re-encoding."""
+    list_path = Path(work_dir) / "segments.txt"
+    with open(list_path, "w") as f:
+        for path in segment_paths:
+            f.write(f"file '{Path(path).resolve()}'\n")
+    run_ffmpeg(["-f", "concat", "-safe", "0", "-i", str(list_path), "-c", "copy",
+                "-movflags", "+faststart", str(output_path)])
+
+def grade_clip(clip: VideoClip, style_transfer: StyleTransfer, style: str,
+               strength: float) -> Tuple[VideoClip, Optional[TemporalStyleCache]]:
+    """Return the clip with the style applied lazily per frame, and its reuse cache if it has one."""
+    if settings.STYLE_MODE == "neural":
+        # Nearly static stretches reuse the previous style transform, applied to their own pixels
+        style_cache = TemporalStyleCache()
+        # Style frames in batches, reading ahead of the (sequential) export
+        fps = clip.fps
+        duration = clip.duration
+        # Frames of the current batch, with the transform each one gets
+        batch: Dict[int, Tuple[np.ndarray, Tuple[np.ndarray, np.ndarray]]] = {}
+        
+        def process_frame(get_frame, t):
+            index = int(round(t * fps))
+            if index not in batch:
+                indices = [i for i in range(index, index + settings.NEURAL_STYLE_BATCH_SIZE) if i / fps < duration]
+                indices = indices or [index]
+                frames = [get_frame(i / fps) for i in indices] if len(indices) > 1 else [get_frame(t)]
+                
+                # Only frames that differ from the last styled one go through the network
+                reused = [style_cache.matches(frame) for frame in frames]
+                computed = iter(style_transfer.style_transforms_batch(
+                    [frame for frame, reuse in zip(frames, reused) if not reuse], style, strength
+                ))
+                batch.clear()
+                for i, frame, reuse in zip(indices, frames, reused):
+                    if not reuse:
+                        style_cache.transform = next(computed)
+                    batch[i] = (frame, style_cache.transform)
+            frame, transform = batch[index]
+            return style_transfer.apply_style_transform(frame, transform)
+        
+        return clip.fl(process_frame, apply_to=[]), style_cache
+    
+    # Compile the preset once for the whole clip; grading a frame is then a per-pixel table lookup
+    lut = style_transfer.compile_lut(style, strength)
+    return clip.fl_image(lambda frame: style_transfer.apply_lut(frame, lut)), None
+
+def export_profile(name: Optional[str]) -> Dict:
+    """Encoder settings of an EXPORT_FORMATS entry; other names keep the source size and frame rate."""
+    profile = {
+        "name": name,
+        "resolution": None,
+        "fps": None,
+        "bitrate": None,
+        "preset": settings.EXPORT_PRESET,
+        "crf": settings.EXPORT_CRF,
+        "threads": settings.EXPORT_THREADS
+    }
+    profile.update(settings.EXPORT_FORMATS.get(name, {}))
+    return profile
+
+def profile_size(profile: Dict) -> Optional[Tuple[int, int]]:
+    """Output (width, height) of a profile, if it sets one."""
+    if not profile.get("resolution"):
+        return None
+    width, height = profile["resolution"].lower().split("x")
+    return int(width), int(height)
+
+def fit_size(size: Tuple[int, int], box: Tuple[int, int]) -> Tuple[int, int]:
+    """Largest size with the aspect ratio of size that fits in box, never upscaling."""
+    scale = min(box[0] / size[0], box[1] / size[1], 1.0)
+    return max(2, int(size[0] * scale) // 2 * 2), max(2, int(size[1] * scale) // 2 * 2)
+
+def encoder_options(profile: Dict) -> Dict:
+    """write_videofile arguments implementing an export profile.
+    
+    Scaling to the profile's resolution (letterboxed to keep the aspect
+    ratio) runs inside the ffmpeg encoder process, not per frame in Python.
+    """
+    ffmpeg_params = ["-pix_fmt", "yuv420p"]
+    if profile["crf"] is not None:
+        ffmpeg_params += ["-crf", str(profile["crf"])]
+        if profile["bitrate"]:
+            # Constant quality, capped at the platform's bitrate
+            rate, unit = re.match(r"(\d+)(\D*)", str(profile["bitrate"])).groups()
+            ffmpeg_params += ["-maxrate", str(profile["bitrate"]), "-bufsize", f"{2 * int(rate)}{unit}"]
+    
+    size = profile_size(profile)
+    if size is not None:
+        width, height = size
+        ffmpeg_params += ["-vf", f"scale={width}:{height}:force_original_aspect_ratio=decrease,"
+                                 f"pad={width}:{height}:(ow-iw)/2:(oh-ih)/2,setsar=1"]
+    
+    options = {
+        "codec": "libx264",
+        "audio_codec": "aac",
+        "preset": profile["preset"],
+        "threads": profile["threads"] or None,
+        "ffmpeg_params": ffmpeg_params
+    }
+    if profile["fps"]:
+        options["fps"] = profile["fps"]
+    if profile["crf"] is None and profile["bitrate"]:
+        options["bitrate"] = profile["bitrate"]
+    return options
+
+def rendition_path(output_path: str, name: str) -> str:
+    """Output file of one rendition, e.g. video.processed.youtube.mp4."""
+    path = Path(output_path)
+    return str(path.with_name(f"{path.stem}.{name}{path.suffix}"))
+
+def write_renditions(clip: VideoClip, renditions: List[Tuple[str, Dict]], work_dir: Path,
+                     audiofile: Optional[str] = None) -> List[int]:
+    """Encode several renditions of a clip while decoding and grading each frame once.
+    
+    Every rendition has its own ffmpeg encoder, fed from a thread through a
+    bounded queue, so the encoders run in parallel and a slow one only
+    stalls the others once its queue is full. Frames are resampled to each
+    profile's frame rate here and scaled inside the encoders; the audio
+    (audiofile, or the clip's audio encoded once) is muxed into every
+    output. Returns the frames written per rendition.
+    """
+    if audiofile is None and clip.audio is not None:
+        audiofile = str(work_dir / "audio.m4a")
+        clip.audio.write_audiofile(audiofile, fps=44100, codec="aac", logger=None)
+    
+    writers, rates = [], []
+    try:
+        for path, profile in renditions:
+            options = encoder_options(profile)
+            rates.append(options.get("fps") or clip.fps)
+            writers.append(FFMPEG_VideoWriter(
+                path, clip.size, rates[-1],
+                codec=options["codec"],
+                preset=options["preset"],
+                bitrate=options.get("bitrate"),
+                audiofile=audiofile,
+                threads=options["threads"],
+                ffmpeg_params=options["ffmpeg_params"]
+            ))
+        
+        queues = [queue.Queue(maxsize=settings.RENDITION_QUEUE_SIZE) for _ in writers]
+        errors: List[Exception] = []
+        def feed(writer: FFMPEG_VideoWriter, frames: queue.Queue):
+            failed = False
+            while True:
+                frame = frames.get()
+                if frame is None:
+                    return
+                if failed:
+                    continue  # Keep draining so the decode loop never blocks on a dead encoder
+                try:
+                    writer.write_frame(frame)
+                except Exception as e:
+                    errors.append(e)
+                    failed = True
+        
+        threads = [threading.Thread(target=feed, args=(w, q), daemon=True) for w, q in zip(writers, queues)]
+        for thread in threads:
+            thread.start()
+        
+        # Decode at the highest output rate; each output takes the latest frame at or before its own times
+        master_fps = max(rates)
+        written = [0] * len(writers)
+        try:
+            for i, frame in enumerate(clip.iter_frames(fps=master_fps, dtype="uint8")):
+                frame_end = (i + 1) / master_fps - 1e-6
+                for k, rate in enumerate(rates):
+                    while written[k] / rate < frame_end:
+                        queues[k].put(frame)
+                        written[k] += 1
+        finally:
+            for q in queues:
+                q.put(None)
+            for thread in threads:
+                thread.join()
+        
+        if errors:
+            raise errors[0]
+        return written
+    finally:
+        for writer in writers:
+            writer.close()
+
+def covers_source(timeline: List[Tuple[float, float]], duration: float, tolerance: float) -> bool:
+    """Whether the time ranges play the whole source in order, with nothing cut out."""
+    position = 0.0
+    for start, end in timeline:
+        if abs(start - position) > tolerance:
+            return False
+        position = end
+    return abs(position - duration) <= tolerance
+
+def split_timeline(timeline: List[Tuple[float, float]], max_duration: float,
+                   fps: float) -> List[Tuple[float, float]]:
+    """Split the kept time ranges into render segments of at most max_duration seconds.
+    
+    Bounds are snapped to the frame grid like smart_cut's cut points, so
+    consecutive segments neither repeat nor drop a frame where they meet.
+    """
+    segments = []
+    for start, end in timeline:
+        first = int(round(frame_time(start, fps) * fps))
+        last = int(round(frame_time(end, fps) * fps))
+        if last <= first:
+            continue
+        count = max(1, int(np.ceil((last - first) / (max_duration * fps) - 1e-9)))
+        bounds = np.linspace(first, last, count + 1).round().astype(int)
+        segments.extend((a / fps, b / fps) for a, b in zip(bounds[:-1], bounds[1:]))
+    return segments
+
+def render_segment(task: Dict) -> Dict[str, float]:
+    """Render one segment of the source video to its own file.
+    
+    Runs in a render worker process, which keeps its own styling model.
+    Returns the segment's style reuse statistics.
+    """
+    global _style_transfer
+    # Downscale while decoding, so grading runs at the output resolution
+    decode_size = task.get("decode_size")
+    source = VideoFileClip(task["video_path"],
+                           target_resolution=(decode_size[1], decode_size[0]) if decode_size else None)
+    try:
+        clip = source.subclip(task["start"], task["end"])
+        style_cache = None
+        if task["style"] is not None:
+            if _style_transfer is None:
+                _style_transfer = StyleTransfer()
+            clip, style_cache = grade_clip(clip, _style_transfer, task["style"], task["strength"])
+        
+        # Exactly the segment's frames are written, so the joined segments keep the source's frame count
+        options = encoder_options(task["profile"])
+        writer = FFMPEG_VideoWriter(
+            task["output_path"], clip.size, task["fps"],
+            codec=options["codec"],
+            preset=options["preset"],
+            bitrate=options.get("bitrate"),
+            threads=options["threads"],
+            ffmpeg_params=options["ffmpeg_params"]
+        )
+        try:
+            for i in range(frames_between(task["start"], task["end"], task["fps"])):
+                writer.write_frame(clip.get_frame(i / task["fps"]).astype("uint8", copy=False))
+        finally:
+            writer.close()
+    finally:
+        source.close()
+    
+    return style_cache.stats() if style_cache is not None else {}
+
+def render_segments(tasks: List[Dict], workers: int) -> List[Dict[str, float]]:
+    """Render segments in a pool of worker processes, returning their stats in order."""
+    # Spawn rather than fork, so workers do not inherit torch thread pools
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+        return list(pool.map(render_segment, tasks))
@@ -0,0 +1,60 @@
+import cv2
+import numpy as np
+from typing import Any, Callable, Dict, Optional
+from app.core.config import settings
+
+class TemporalStyleCache:
+    """Reuses the last style transform while the video stays nearly static.
+
+    Only the transform is reused, never styled pixels: it is applied to
+    every frame's own content, so small motion still shows in the output.
+    Frames are compared by the mean absolute difference of small grayscale
+    thumbnails. Comparisons are made against the frame that produced the
+    cached transform rather than the previous frame, so slow drift
+    eventually triggers a restyle.
+    """
+    THUMBNAIL_SIZE = (64, 36)
+
+    def __init__(self, threshold: Optional[float] = None):
+        self.threshold = threshold if threshold is not None else settings.STYLE_REUSE_THRESHOLD
+        self.hits = 0
+        self.misses = 0
+        # Thumbnail of the frame whose style transform is cached
+        self.signature: Optional[np.ndarray] = None
+        self.transform: Optional[Any] = None
+
+    def thumbnail(self, frame: np.ndarray) -> np.ndarray:
+        """Downscaled grayscale version of the frame in [0, 1]."""
+        gray = cv2.cvtColor(frame, cv2.COLOR_RGB2GRAY)
+        return cv2.resize(gray, self.THUMBNAIL_SIZE, interpolation=cv2.INTER_AREA).astype(np.float32) / 255
+
+    def matches(self, frame: np.ndarray) -> bool:
+        """Whether the cached transform can be reused for this frame.
+
+        On a miss the frame becomes the new reference, and the caller is
+        expected to set `transform` to its style transform.
+        """
+        signature = self.thumbnail(frame)
+        if self.signature is not None and self.signature.shape == signature.shape and \
+                float(np.mean(np.abs(signature - self.signature))) <= self.threshold:
+            self.hits += 1
+            return True
+
+        self.misses += 1
+        self.signature = signature
+        self.transform = None
+        return False
+
+    def lookup(self, frame: np.ndarray, style_transform: Callable[[np.ndarray], Any]) -> Any:
+        """Style transform of a frame, reusing the previous one for nearly identical frames."""
+        if not self.matches(frame) or self.transform is None:
+            self.transform = style_transform(frame)
+        return self.transform
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def stats(self) -> Dict[str, float]:
+        return {"hits": self.hits, "misses": self.misses, "hit_rate": self.hit_rate}
@@ -1,4 +1,7 @@
 import cv2
+import os
+import tempfile
+import time
 import numpy as np
 from pathlib import Path
 from typing import List, Tuple, Optional, Dict
@@ -6,6 +9,13 @@ from moviepy.editor import VideoFileClip, concatenate_videoclips
 from app.models.scene_analyzer import SceneAnalyzer
 from app.models.style_transfer import StyleTransfer
 from app.core.config import settings
+from app.core.frame_buffer import FrameSampleBuffer
+from app.core.feature_cache import FeatureCache
+from app.core.style_cache import TemporalStyleCache
+from app.core.render import (COPYABLE_AUDIO_CODECS, can_stream_copy, concat_segments, covers_source,
+                             encoder_options, export_profile, extract_audio, fit_size, frame_time, grade_clip,
+                             mux_audio, mux_timeline_audio, probe_video, profile_size, render_segments,
+                             rendition_path, smart_cut, split_timeline, write_renditions)
 
 class VideoProcessor:
     def __init__(self):
@@ -13,83 +23,227 @@ class VideoProcessor:
         self.scenes: List[Tuple[float, float]] = []
         self.scene_analyzer = SceneAnalyzer()
         self.style_transfer = StyleTransfer()
-        self.frame_buffer: List[np.ndarray] = []
+        self.frame_buffer = FrameSampleBuffer(settings.SCENE_BUFFER_SIZE)
         self.scene_qualities: List[Dict] = []
         self.scene_importances: List[float] = []
         self.scene_continuities: List[Dict] = []
         self.scene_motion_data: List[List[Dict]] = []
+        self.scene_contents: Dict[Tuple[float, float], Dict] = {}
+        self.sample_times: List[float] = []
+        self.sample_features: List[np.ndarray] = []
+        self.feature_cache = FeatureCache()
+        self.style_cache: Optional[TemporalStyleCache] = None
+        self.video_hash: Optional[str] = None
+        # Edit applied to the source file, for segmented export
+        self.video_path: Optional[str] = None
+        self.timeline: Optional[List[Tuple[float, float]]] = None
+        self.grading: Optional[Tuple[str, float]] = None
+        self.export_stats: Optional[Dict] = None
         
     def load_video(self, video_path: str) -> bool:
         """Load a video file for processing."""
         try:
             self.current_video = VideoFileClip(video_path)
+            self.video_path = video_path
+            self.timeline = None
+            self.grading = None
+            self.export_stats = None
+            self.sample_times = []
+            self.sample_features = []
+            self.video_hash = self.feature_cache.hash_file(video_path) if self.feature_cache.enabled else None
             return True
         except Exception as e:
             print(f"Error loading video: {e}")
             return False
     
-    def detect_scenes(self, threshold: float = 30.0) -> List[Tuple[float, float]]:
-        """Detect scene changes using AI-based analysis."""
+    def detect_scenes(self, threshold: Optional[float] = None, adaptive: Optional[bool] = None) -> List[Tuple[float, float]]:
+        """Detect scene changes and analyze each scene in a single decode pass."""
         if not self.current_video:
             return []
-            
-        # Extract frames for analysis
-        frames = []
-        frame_count = 0
-        for frame in self.current_video.iter_frames():
-            if frame_count % 30 == 0:  # Sample every second (assuming 30fps)
-                frames.append(frame)
-            frame_count += 1
-        
-        # Use AI to detect scenes
-        scenes = self.scene_analyzer.detect_scenes(frames, threshold)
         
-        # Convert frame indices to timestamps
-        self.scenes = [(start/30, end/30) for start, end in scenes]
+        threshold = settings.SCENE_SIMILARITY_THRESHOLD if threshold is None else threshold
+        adaptive = settings.SCENE_ADAPTIVE_THRESHOLD if adaptive is None else adaptive
         
-        # Analyze scenes
+        self.scenes = []
         self.scene_qualities = []
         self.scene_importances = []
         self.scene_continuities = []
         self.scene_motion_data = []
+        self.scene_contents = {}
+        self.sample_times = []
+        self.sample_features = []
         
-        for start_time, end_time in self.scenes:
-            # Get frames for this scene
-            scene_frames = []
-            for frame in self.current_video.subclip(start_time, end_time).iter_frames():
-                scene_frames.append(frame)
+        # Decode the video once: sampled frames drive scene detection while
+        # every frame streams through the analyzers of the current scene.
+        # At most SCENE_BUFFER_SIZE frames of a scene, evenly spaced, are ever kept.
+        self.frame_buffer.clear()
+        sample_step = self._sample_step()
+        cached_features = self._load_cached_features()
+        # With the pre-filter, cuts also depend on frame signatures, so they are found online
+        boundaries = None if settings.SCENE_PREFILTER else \
+            self._cached_boundaries(cached_features, sample_step, threshold, adaptive)
+        tracker = self.scene_analyzer.object_tracker
+        tracker.detection_cache = self.feature_cache.load_detections(self.video_hash, tracker.model_version)
+        tracker.reset()
+        scene_start = 0.0
+        scene_content = None
+        motion_data: List[Dict] = []
+        # Frames wait here until a full detection batch is ready
+        pending_frames: List[np.ndarray] = []
+        pending_times: List[float] = []
+        prev_frame = None
+        prev_features = None
+        prev_signature = None
+        prev_estimated = False
+        # Estimated embeddings are never cached, so later runs make the same decisions
+        sample_estimated: List[bool] = []
+        similarities: List[float] = []
+        frame_count = 0
+        for t, frame in self.current_video.iter_frames(with_times=True):
+            if frame_count % sample_step == 0:
+                features = cached_features.get(FeatureCache.timestamp_key(t))
+                estimated = False
+                if boundaries is not None:
+                    is_boundary = len(self.sample_times) in boundaries
+                else:
+                    # Cheap pre-filter: only samples that visibly differ from the
+                    # previous one are compared with the deep model
+                    signature = self.scene_analyzer.frame_signature(frame) if settings.SCENE_PREFILTER else None
+                    candidate = prev_signature is None or signature is None or \
+                        self.scene_analyzer.signature_distances([prev_signature, signature])[0] >= settings.SCENE_PREFILTER_THRESHOLD
+                    if not candidate:
+                        # Nearly identical to the previous sample: never a cut, and its
+                        # embedding is the previous one unless the real one is cached
+                        if features is None:
+                            features = prev_features
+                            estimated = True
+                        similarities.append(1.0)
+                        is_boundary = False
+                    else:
+                        if prev_estimated:
+                            # The previous embedding was reused, compute the real one (alongside this sample)
+                            if features is None:
+                                prev_features, features = self.scene_analyzer.extract_features_batch([prev_frame, frame])
+                            else:
+                                prev_features = self.scene_analyzer.extract_features(prev_frame)
+                            self.sample_features[-1] = prev_features
+                            sample_estimated[-1] = False
+                        elif features is None:
+                            features = self.scene_analyzer.extract_features(frame)
+                        is_boundary = prev_features is not None and \
+                            self._is_boundary(prev_features, features, similarities, threshold, adaptive)
+                    prev_signature = signature
+                if is_boundary:
+                    self._track_pending(pending_frames, pending_times, motion_data)
+                    self._finish_scene(scene_start, t, scene_content, motion_data)
+                    # Objects never carry over a cut
+                    tracker.reset()
+                    scene_start = t
+                    scene_content = None
+                    motion_data = []
+                prev_frame = frame
+                prev_features = features
+                prev_estimated = estimated
+                self.sample_times.append(t)
+                self.sample_features.append(features)
+                sample_estimated.append(estimated)
             
-            if scene_frames:
-                # Analyze quality
-                quality = self.scene_analyzer.analyze_scene_quality(scene_frames[0])
-                self.scene_qualities.append(quality)
-                
-                # Track motion with object tracking
-                motion_data = self.scene_analyzer.track_motion(scene_frames)
-                self.scene_motion_data.append(motion_data)
-                
-                # Calculate importance
-                importance = self.scene_analyzer.calculate_scene_importance(scene_frames[0], motion_data)
-                self.scene_importances.append(importance)
-                
-                # Analyze continuity
-                continuity = self.scene_analyzer.analyze_scene_continuity(scene_frames)
-                self.scene_continuities.append(continuity)
+            # Analyze content on the first frame, so analyze_scene_content() does not decode again
+            if scene_content is None:
+                scene_content = self.scene_analyzer.analyze_scene_content(frame)
+            
+            # Track motion with object tracking, detecting objects in batches
+            pending_frames.append(frame)
+            pending_times.append(t)
+            if len(pending_frames) == settings.DETECTION_BATCH_SIZE:
+                self._track_pending(pending_frames, pending_times, motion_data)
+            self.frame_buffer.append(frame)
+            frame_count += 1
+        
+        if scene_content is not None:
+            self._track_pending(pending_frames, pending_times, motion_data)
+            self._finish_scene(scene_start, self.current_video.duration, scene_content, motion_data)
+        
+        real = [i for i, estimated in enumerate(sample_estimated) if not estimated]
+        self.feature_cache.save_features(
+            self.video_hash, self.scene_analyzer.model_version,
+            [self.sample_times[i] for i in real], [self.sample_features[i] for i in real]
+        )
+        self.feature_cache.save_detections(self.video_hash, tracker.model_version, tracker.detection_cache)
         
         return self.scenes
     
+    def _track_pending(self, frames: List[np.ndarray], times: List[float], motion_data: List[Dict]):
+        """Run object tracking over the frames waiting for a detection batch."""
+        # Timestamps are only passed down when detections can be cached
+        timestamps = times if self.video_hash is not None else None
+        motion_data.extend(self.scene_analyzer.track_frames_motion(frames, timestamps))
+        frames.clear()
+        times.clear()
+    
+    def _sample_step(self) -> int:
+        """Number of frames between two samples at SCENE_SAMPLE_RATE, using the clip's real fps."""
+        return max(1, int(round(self.current_video.fps / settings.SCENE_SAMPLE_RATE)))
+    
+    def _is_boundary(self, prev_features: np.ndarray, features: np.ndarray, similarities: List[float],
+                     threshold: float, adaptive: bool) -> bool:
+        """Decide online whether a sample starts a new scene."""
+        similarities.append(self.scene_analyzer.feature_similarity(prev_features, features))
+        window = similarities[-(settings.SCENE_ADAPTIVE_WINDOW + 1):]
+        cut_threshold = self.scene_analyzer.boundary_thresholds(np.asarray(window), threshold, adaptive)[-1]
+        return similarities[-1] < cut_threshold
+    
+    def _cached_boundaries(self, cached_features: Dict[float, np.ndarray], sample_step: int,
+                           threshold: float, adaptive: bool) -> Optional[set]:
+        """Find every scene boundary up front when all sampled features are cached."""
+        if not cached_features:
+            return None
+        
+        # iter_frames() yields frames at the same timestamps
+        frame_times = np.arange(0, self.current_video.duration, 1.0 / self.current_video.fps)
+        keys = [FeatureCache.timestamp_key(t) for t in frame_times[::sample_step]]
+        if not all(key in cached_features for key in keys):
+            return None
+        
+        features = np.stack([cached_features[key] for key in keys])
+        return set(self.scene_analyzer.detect_boundaries(features, threshold, adaptive).tolist())
+    
+    def _finish_scene(self, start_time: float, end_time: float, content: Dict, motion_data: List[Dict]):
+        """Record the analyses of a scene once its last frame has been decoded."""
+        self.scenes.append((start_time, end_time))
+        self.scene_contents[(start_time, end_time)] = content
+        
+        if len(motion_data) < 2:
+            motion_data = []
+        self.scene_motion_data.append(motion_data)
+        
+        # Analyze quality over the frames sampled across the scene
+        quality = self.scene_analyzer.analyze_scene_quality(self.frame_buffer)
+        self.scene_qualities.append(quality)
+        
+        # Calculate importance
+        importance = self.scene_analyzer.calculate_scene_importance(self.frame_buffer, motion_data)
+        self.scene_importances.append(importance)
+        
+        # Analyze continuity from the motion tracked during decoding
+        continuity = self.scene_analyzer.analyze_scene_continuity(motion_data=motion_data)
+        self.scene_continuities.append(continuity)
+        
+        self.frame_buffer.clear()
+    
     def apply_color_grading(self, style: str = "cinematic", strength: float = 0.5) -> bool:
-        """Apply AI-powered style transfer to the video."""
+        """Grade the video with a style preset, or style it neurally when STYLE_MODE is neural."""
         if not self.current_video:
             return False
             
+        # Without a visible effect the frames stay untouched, which keeps the stream-copy export available
+        if not style or style == "none" or strength <= 0:
+            return True
+        
         try:
-            def process_frame(frame):
-                # Apply style transfer to each frame
-                return self.style_transfer.apply_style(frame, style, strength)
-            
-            # Process the video
-            self.current_video = self.current_video.fl_image(process_frame)
+            self.current_video, self.style_cache = grade_clip(self.current_video, self.style_transfer, style, strength)
+            # Remembered so that segmented export can rebuild the grade per segment
+            self.grading = (style, strength)
             return True
         except Exception as e:
             print(f"Error applying color grading: {e}")
@@ -102,19 +256,17 @@ class VideoProcessor:
             
         scene_analyses = []
         for start_time, end_time in self.scenes:
-            # Extract frames for this scene
-            scene_frames = []
-            for frame in self.current_video.subclip(start_time, end_time).iter_frames():
-                scene_frames.append(frame)
+            # Reuse the analysis from the detection pass when available
+            analysis = self.scene_contents.get((start_time, end_time))
+            if analysis is None:
+                frame = self.current_video.get_frame(start_time)
+                analysis = self.scene_analyzer.analyze_scene_content(frame)
             
-            # Analyze the scene
-            if scene_frames:
-                analysis = self.scene_analyzer.analyze_scene_content(scene_frames[0])
-                scene_analyses.append({
-                    "start_time": start_time,
-                    "end_time": end_time,
-                    "analysis": analysis
-                })
+            scene_analyses.append({
+                "start_time": start_time,
+                "end_time": end_time,
+                "analysis": analysis
+            })
         
         return scene_analyses
     
@@ -122,20 +274,46 @@ class VideoProcessor:
         """Get the timestamps of key frames in the video."""
         if not self.current_video:
             return []
-            
-        # Extract frames for analysis
-        frames = []
-        frame_count = 0
-        for frame in self.current_video.iter_frames():
-            if frame_count % 30 == 0:  # Sample every second
-                frames.append(frame)
-            frame_count += 1
+        
+        # Reuse the features sampled by detect_scenes, or cached by an earlier
+        # job on the same footage, instead of decoding again
+        if not self.sample_features:
+            cached_features = self._load_cached_features()
+            if cached_features:
+                self.sample_times = sorted(cached_features)
+                self.sample_features = [cached_features[t] for t in self.sample_times]
+        
+        if not self.sample_features:
+            pending = []
+            sample_step = self._sample_step()
+            frame_count = 0
+            for t, frame in self.current_video.iter_frames(with_times=True):
+                if frame_count % sample_step == 0:
+                    self.sample_times.append(t)
+                    pending.append(frame)
+                    if len(pending) == settings.FEATURE_BATCH_SIZE:
+                        self.sample_features.extend(self.scene_analyzer.extract_features_batch(pending))
+                        pending = []
+                frame_count += 1
+            self.sample_features.extend(self.scene_analyzer.extract_features_batch(pending))
+            self.feature_cache.save_features(
+                self.video_hash, self.scene_analyzer.model_version, self.sample_times, self.sample_features
+            )
+        
+        if not self.sample_features:
+            return []
         
         # Get keyframe indices
-        keyframe_indices = self.scene_analyzer.get_keyframes(frames, num_keyframes)
+        keyframe_indices = self.scene_analyzer.select_keyframes(
+            np.stack(self.sample_features), num_keyframes
+        )
         
         # Convert to timestamps
-        return [idx/30 for idx in keyframe_indices]
+        return [float(self.sample_times[idx]) for idx in keyframe_indices]
+    
+    def _load_cached_features(self) -> Dict[float, np.ndarray]:
+        """Load the sampled features cached for the current video, if any."""
+        return self.feature_cache.load_features(self.video_hash, self.scene_analyzer.model_version)
     
     def add_transitions(self, transition_type: str = "fade") -> bool:
         """Add transitions between scenes."""
@@ -153,11 +331,20 @@ class VideoProcessor:
             if transition_type == "fade":
                 final_clip = concatenate_videoclips(scene_clips, method="compose")
                 self.current_video = final_clip
+                self.timeline = list(self.scenes)
             return True
         except Exception as e:
             print(f"Error adding transitions: {e}")
             return False
     
+    def compact_motion_data(self, precision: int = 4) -> List[Dict[str, List[float]]]:
+        """Per-scene motion data with one list per metric, for JSON results."""
+        return [
+            {key: [round(m[key], precision) for m in motion_data]
+             for key in ("magnitude", "direction", "variance", "num_objects")}
+            for motion_data in self.scene_motion_data
+        ]
+    
     def optimize_scenes(self, min_quality_threshold: float = 0.6, min_importance_threshold: float = 0.4) -> List[Tuple[float, float]]:
         """Optimize scene selection based on quality, importance, and motion analysis."""
         if not self.scenes or not self.scene_qualities or not self.scene_importances:
@@ -205,32 +392,194 @@ class VideoProcessor:
         self.scenes = optimized_scenes
         return optimized_scenes
     
-    def export_video(self, output_path: str, format: str = "mp4") -> bool:
-        """Export the processed video."""
+    def export_video(self, output_path: str, format: str = "mp4", formats: Optional[List[str]] = None) -> bool:
+        """Export the processed video with the encoder profile of an EXPORT_FORMATS entry.
+        
+        With several formats, every rendition is written next to output_path
+        (see rendition_path) from a single decode and grading pass.
+        """
         if not self.current_video:
             return False
             
         try:
-            self.current_video.write_videofile(
-                output_path,
-                codec='libx264',
-                audio_codec='aac',
-                temp_audiofile="temp-audio.m4a",
-                remove_temp=True
-            )
+            # A single requested format is an ordinary export to output_path
+            if formats and len(formats) == 1:
+                format = formats[0]
+            
+            # Scratch files of this export live in their own directory, removed afterwards
+            with tempfile.TemporaryDirectory(prefix="editorist-export-", dir=settings.TEMP_DIR) as work_dir:
+                if formats and len(formats) > 1:
+                    self._export_renditions(output_path, formats, Path(work_dir))
+                    return True
+                
+                profile = export_profile(format)
+                started = time.perf_counter()
+                mode = self._export(output_path, profile, Path(work_dir))
+                elapsed = time.perf_counter() - started
+            
+            frames = int(round(self.current_video.duration * (profile["fps"] or self.current_video.fps)))
+            self.export_stats = {
+                "format": format,
+                "mode": mode,
+                "frames": frames,
+                "seconds": round(elapsed, 3),
+                "encode_fps": round(frames / elapsed, 2) if elapsed > 0 else 0.0
+            }
             return True
         except Exception as e:
             print(f"Error exporting video: {e}")
             return False
     
+    def _export_renditions(self, output_path: str, formats: List[str], work_dir: Path):
+        """Encode one rendition per format, sharing decoding and grading between them."""
+        renditions = [(rendition_path(output_path, name), export_profile(name)) for name in formats]
+        started = time.perf_counter()
+        written = write_renditions(self.current_video, renditions, work_dir, self._source_audio(work_dir))
+        elapsed = time.perf_counter() - started
+        
+        # The encoders ran side by side, so each one had the whole pass to itself
+        self.export_stats = {
+            "mode": "renditions",
+            "seconds": round(elapsed, 3),
+            "renditions": {
+                name: {
+                    "path": path,
+                    "frames": frames,
+                    "encode_fps": round(frames / elapsed, 2) if elapsed > 0 else 0.0
+                }
+                for name, (path, _), frames in zip(formats, renditions, written)
+            }
+        }
+    
+    def _export(self, output_path: str, profile: Dict, work_dir: Path) -> str:
+        """Write the output with the fastest applicable method and return its name."""
+        if self._export_stream_copy(output_path, profile, work_dir):
+            return "stream_copy"
+        
+        workers = settings.RENDER_WORKERS or os.cpu_count() or 1
+        segments = self._render_segments(profile)
+        if settings.SEGMENTED_RENDER and workers > 1 and len(segments) > 1:
+            self._export_segmented(output_path, segments, workers, profile, work_dir)
+            return "segmented"
+        
+        # Unchanged source audio is muxed as is instead of being decoded and encoded again
+        source_audio = self._source_audio(work_dir)
+        self.current_video.write_videofile(
+            output_path,
+            audio=source_audio or True,
+            temp_audiofile=str(work_dir / "audio.m4a"),
+            remove_temp=True,
+            **encoder_options(profile)
+        )
+        return "single"
+    
+    def _source_audio(self, work_dir: Path) -> Optional[str]:
+        """Copy of the source's audio track when the output keeps it unchanged, else None."""
+        if self.video_path is None or self.current_video.audio is None:
+            return None
+        probe = probe_video(self.video_path)
+        if probe["audio_codec"] not in COPYABLE_AUDIO_CODECS:
+            return None
+        # Cutting scenes changes the audio too, but joining every scene back to back does not
+        if self.timeline is not None and not covers_source(self.timeline, probe["duration"] or 0.0,
+                                                           0.5 / (probe["fps"] or self.current_video.fps)):
+            return None
+        audio_path = str(work_dir / "source-audio.mp4")
+        extract_audio(self.video_path, audio_path)
+        return audio_path
+    
+    def _export_stream_copy(self, output_path: str, profile: Dict, work_dir: Path) -> bool:
+        """Cut the source without re-encoding when no pixel-level effect was applied."""
+        if not settings.STREAM_COPY_CUTS or self.video_path is None or self.grading is not None:
+            return False
+        # Copied frames keep the source size and frame rate
+        if profile["resolution"] is not None or profile["fps"] is not None:
+            return False
+        probe = probe_video(self.video_path)
+        if not can_stream_copy(probe):
+            return False
+        
+        timeline = self.timeline if self.timeline is not None else [(0.0, probe["duration"])]
+        smart_cut(self.video_path, timeline, output_path, work_dir,
+                  probe["duration"], probe["fps"], has_audio=probe["audio_codec"] is not None)
+        return True
+    
+    def _render_segments(self, profile: Dict) -> List[Tuple[float, float]]:
+        """Time ranges of the source video that make up the output, split for parallel rendering."""
+        if self.video_path is None:
+            return []
+        timeline = self.timeline if self.timeline is not None else [(0.0, self.current_video.duration)]
+        return split_timeline(timeline, settings.RENDER_SEGMENT_SECONDS, self._render_fps(profile))
+    
+    def _render_fps(self, profile: Dict) -> float:
+        """Frame rate of the rendered output."""
+        return profile["fps"] or self.current_video.fps
+    
+    def _export_segmented(self, output_path: str, segments: List[Tuple[float, float]], workers: int,
+                          profile: Dict, work_dir: Path):
+        """Render segments in parallel from the source file, then join them with stream copy."""
+        style, strength = self.grading if self.grading is not None else (None, 0.0)
+        box = profile_size(profile)
+        decode_size = fit_size(tuple(self.current_video.size), box) if box is not None else None
+        fps = self._render_fps(profile)
+        # Encoders running side by side share the cores instead of each sizing a pool for all of them
+        workers = min(workers, len(segments))
+        segment_profile = dict(profile, threads=profile["threads"] or max(1, (os.cpu_count() or 1) // workers))
+        # Segments are rendered without audio; the track is added once to the joined video
+        source_audio = self._source_audio(work_dir)
+        tasks = [
+            {
+                "video_path": self.video_path,
+                "start": start,
+                "end": end,
+                "style": style,
+                "strength": strength,
+                "profile": segment_profile,
+                "decode_size": decode_size,
+                "fps": fps,
+                "output_path": str(work_dir / f"segment-{i:05d}.mp4")
+            }
+            for i, (start, end) in enumerate(segments)
+        ]
+        stats = render_segments(tasks, workers)
+        if self.current_video.audio is None:
+            concat_segments([task["output_path"] for task in tasks], output_path, work_dir)
+        else:
+            video_path = str(work_dir / "video.mp4")
+            concat_segments([task["output_path"] for task in tasks], video_path, work_dir)
+            if source_audio is not None:
+                mux_audio(video_path, source_audio, output_path)
+            else:
+                # Cut or re-encoded audio is trimmed from the source and encoded in one pass
+                # Cut at the same frame times as the video, so the two stay in sync
+                timeline = self.timeline if self.timeline is not None else [(0.0, self.current_video.duration)]
+                timeline = [(frame_time(start, fps), frame_time(end, fps)) for start, end in timeline]
+                mux_timeline_audio(self.video_path, video_path, timeline, output_path)
+        
+        # Workers styled the frames, so collect their reuse statistics
+        if self.style_cache is not None:
+            self.style_cache.hits = sum(s.get("hits", 0) for s in stats)
+            self.style_cache.misses = sum(s.get("misses", 0) for s in stats)
+    
     def cleanup(self):
         """Clean up resources."""
         if self.current_video:
             self.current_video.close()
             self.current_video = None
         self.scenes = []
-        self.frame_buffer = []
+        self.frame_buffer.clear()
         self.scene_qualities = []
         self.scene_importances = []
         self.scene_continuities = []
-        self.scene_motion_data = [] 
\ No newline at end of file
+        self.scene_motion_data = []
+        self.scene_contents = {}
+        self.sample_times = []
+        self.sample_features = []
+        self.video_hash = None
+        self.scene_analyzer.object_tracker.detection_cache = {}
+        self.scene_analyzer.object_tracker.reset()
+        self.style_cache = None
+        self.video_path = None
+        self.timeline = None
+        self.grading = None
+        self.export_stats = None 
\ No newline at end of file
@@ -1,44 +1,93 @@
-import asyncio
+import os
+import signal
+import socket
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
 from typing import Dict, Optional
 from app.core.job_queue import JobQueue
+from app.core.render import rendition_path
 from app.core.video_processor import VideoProcessor
 from app.core.config import settings
 
 class VideoWorker:
+    """Processes queued jobs in its own process, away from the API's event loop.
+    
+    Run it standalone with `python -m app.core.worker`, or let the API start
+    WORKER_PROCESSES of them.
+    """
+    
     def __init__(self):
         self.job_queue = JobQueue()
         self.video_processor = VideoProcessor()
         self.is_running = False
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.last_reap = 0.0
     
-    async def start(self):
-        """Start the worker process."""
+    def start(self):
+        """Process jobs until stopped."""
         self.is_running = True
         while self.is_running:
             try:
-                # Get next job
-                job_id = self.job_queue.get_next_job()
+                self.reap_stalled_jobs()
+                
+                # Blocks until a job arrives, so pickup is immediate without polling
+                job_id = self.job_queue.get_next_job(self.worker_id)
                 if job_id:
-                    await self.process_job(job_id)
-                else:
-                    # No jobs, wait before checking again
-                    await asyncio.sleep(1)
+                    self.process_job(job_id)
             except Exception as e:
                 print(f"Error in worker: {e}")
-                await asyncio.sleep(5)  # Wait before retrying
+                time.sleep(5)  # Wait before retrying
     
-    async def stop(self):
-        """Stop the worker process."""
+    def stop(self):
+        """Stop after the current job; an idle worker stops within JOB_DEQUEUE_TIMEOUT."""
         self.is_running = False
     
-    async def process_job(self, job_id: str):
-        """Process a single video job."""
+    def reap_stalled_jobs(self):
+        """Requeue jobs of crashed workers and sweep old jobs, at most every JOB_REAPER_INTERVAL seconds."""
+        now = time.monotonic()
+        if now - self.last_reap < settings.JOB_REAPER_INTERVAL:
+            return
+        self.last_reap = now
+        for job_id in self.job_queue.requeue_stalled_jobs():
+            print(f"Requeued stalled job {job_id}")
+        self.job_queue.cleanup_old_jobs(settings.JOB_RETENTION_HOURS)
+    
+    @contextmanager
+    def heartbeat(self, job_id: str):
+        """Send heartbeats for a job from a background thread while the block runs."""
+        stopped = threading.Event()
+        def beat():
+            while not stopped.wait(settings.JOB_HEARTBEAT_INTERVAL):
+                try:
+                    self.job_queue.heartbeat(job_id)
+                except Exception as e:
+                    print(f"Error sending heartbeat: {e}")
+        
+        thread = threading.Thread(target=beat, daemon=True)
+        thread.start()
+        try:
+            yield
+        finally:
+            stopped.set()
+            thread.join()
+    
+    def process_job(self, job_id: str):
+        """Process a single video job, then remove it from this worker's processing list."""
+        try:
+            with self.heartbeat(job_id):
+                self._process_job(job_id)
+        finally:
+            self.job_queue.ack_job(job_id, self.worker_id)
+    
+    def _process_job(self, job_id: str):
         try:
-            # Get job details
-            job_data = self.job_queue.get_job_status(job_id)
+            # Mark the job as processing and get its details
+            job_data = self.job_queue.start_job(job_id, self.worker_id)
             if not job_data:
                 return
-            
-            # Update status to processing
             self.job_queue.update_job_progress(job_id, 0, "processing")
             
             # Load video
@@ -64,44 +113,63 @@ class VideoWorker:
                 self.job_queue.update_job_progress(job_id, 50, "analyzing_content")
                 content_analysis = self.video_processor.analyze_scene_content()
             
-            # Apply color grading
-            self.job_queue.update_job_progress(job_id, 60, "applying_color_grading")
-            if not self.video_processor.apply_color_grading(
-                job_data["params"].get("style", "cinematic"),
-                job_data["params"].get("strength", 0.5)
-            ):
-                raise Exception("Failed to apply color grading")
-            
-            # Add transitions
-            if scenes:
-                self.job_queue.update_job_progress(job_id, 70, "adding_transitions")
-                if not self.video_processor.add_transitions(
-                    job_data["params"].get("transitions", "fade")
+            # Analysis-only jobs stop before rendering
+            analysis_only = job_data["params"].get("analysis_only", False)
+            output_path = None
+            export_formats = []
+            if not analysis_only:
+                # Apply color grading
+                self.job_queue.update_job_progress(job_id, 60, "applying_color_grading")
+                if not self.video_processor.apply_color_grading(
+                    job_data["params"].get("style", "cinematic"),
+                    job_data["params"].get("strength", 0.5)
                 ):
-                    raise Exception("Failed to add transitions")
+                    raise Exception("Failed to apply color grading")
             
-            # Export video
-            self.job_queue.update_job_progress(job_id, 80, "exporting_video")
-            output_path = str(Path(job_data["video_path"]).with_suffix('.processed.mp4'))
-            if not self.video_processor.export_video(output_path):
-                raise Exception("Failed to export video")
+                # Add transitions
+                if scenes:
+                    self.job_queue.update_job_progress(job_id, 70, "adding_transitions")
+                    if not self.video_processor.add_transitions(
+                        job_data["params"].get("transitions", "fade")
+                    ):
+                        raise Exception("Failed to add transitions")
             
-            # Cleanup
-            self.video_processor.cleanup()
+                # Export video
+                self.job_queue.update_job_progress(job_id, 80, "exporting_video")
+                output_path = str(Path(job_data["video_path"]).with_suffix('.processed.mp4'))
+                export_formats = job_data["params"].get("export_formats") or []
+                if not self.video_processor.export_video(
+                    output_path,
+                    job_data["params"].get("export_format") or "mp4",
+                    export_formats
+                ):
+                    raise Exception("Failed to export video")
             
             # Prepare result
             result = {
-                "message": "Video processed successfully",
-                "output_path": output_path,
+                "message": "Video analyzed successfully" if analysis_only else "Video processed successfully",
                 "scenes": scenes,
                 "content_analysis": content_analysis
             }
+            if output_path is not None:
+                result["output_path"] = output_path
+            if len(export_formats) > 1:
+                result["output_paths"] = {name: rendition_path(output_path, name) for name in export_formats}
+                result["output_path"] = result["output_paths"][export_formats[0]]
             
             # Add motion and continuity analysis if requested
             if job_data["params"].get("analyze_motion", True):
-                result["scene_motion_data"] = self.video_processor.scene_motion_data
+                result["scene_motion_data"] = self.video_processor.compact_motion_data()
             if job_data["params"].get("analyze_continuity", True):
                 result["scene_continuities"] = self.video_processor.scene_continuities
+            if self.video_processor.export_stats is not None:
+                result["export_stats"] = self.video_processor.export_stats
+            # Report how often styled frames were reused
+            if self.video_processor.style_cache is not None:
+                result["style_cache"] = self.video_processor.style_cache.stats()
+            
+            # Cleanup once the analyses have been copied into the result
+            self.video_processor.cleanup()
             
             # Mark job as completed
             self.job_queue.complete_job(job_id, result)
@@ -109,4 +177,16 @@ class VideoWorker:
         except Exception as e:
             self.video_processor.cleanup()
             self.job_queue.fail_job(job_id, str(e))
-            raise 
\ No newline at end of file
+            raise 
+
+def run_worker():
+    """Run a worker until SIGTERM or SIGINT."""
+    worker = VideoWorker()
+    def handle_signal(signum, frame):
+        worker.stop()
+    signal.signal(signal.SIGTERM, handle_signal)
+    signal.signal(signal.SIGINT, handle_signal)
+    worker.start()
+
+if __name__ == "__main__":
+    run_worker()
@@ -3,8 +3,8 @@ from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 from pathlib import Path
 from app.api.video_router import router as video_router
-from app.core.worker import VideoWorker
-import asyncio
+from app.core.worker import run_worker
+import multiprocessing
 from app.core.config import settings
 
 # Create FastAPI app
@@ -33,18 +33,31 @@ app.mount("/static", StaticFiles(directory="static"), name="static")
 # Include routers
 app.include_router(video_router, prefix="/api/v1/videos", tags=["videos"])
 
-# Create worker instance
-worker = VideoWorker()
+# Worker processes started with the API; jobs never run on its event loop
+worker_processes = []
 
 @app.on_event("startup")
 async def startup_event():
-    """Start the video processing worker."""
-    asyncio.create_task(worker.start())
+    """Start the video processing workers."""
+    # Spawn rather than fork, so workers do not inherit the server's threads and sockets
+    context = multiprocessing.get_context("spawn")
+    for _ in range(settings.WORKER_PROCESSES):
+        process = context.Process(target=run_worker, name="editorist-worker")
+        process.start()
+        worker_processes.append(process)
 
 @app.on_event("shutdown")
 async def shutdown_event():
-    """Stop the video processing worker."""
-    await worker.stop()
+    """Stop the video processing workers."""
+    for process in worker_processes:
+        process.terminate()  # SIGTERM lets an idle worker finish its dequeue wait
+    for process in worker_processes:
+        process.join(settings.JOB_DEQUEUE_TIMEOUT + 5)
+        # A worker still busy is killed; its job is requeued once its heartbeat stops
+        if process.is_alive():
+            process.kill()
+            process.join()
+    worker_processes.clear()
 
 @app.get("/")
 async def root():
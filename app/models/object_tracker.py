@@ -1,18 +1,47 @@
 import cv2
 import numpy as np
-from typing import List, Dict, Tuple, Optional
+from typing import List, Dict, Tuple, Optional, Sequence
 from pathlib import Path
 import torch
 from app.core.config import settings
 
+class Track:
+    """State of one tracked object, with its recent centers in a fixed-size ring."""
+    __slots__ = ("track_id", "tracker", "bbox", "history", "lost_frames")
+    
+    def __init__(self, track_id: int, history_length: int):
+        self.track_id = track_id
+        self.tracker: Optional[cv2.Tracker] = None
+        self.bbox: Optional[Tuple[float, float, float, float]] = None
+        self.history = np.full((history_length, 2), np.nan, dtype=np.float32)
+        # Consecutive frames the object has not been found in
+        self.lost_frames = 0
+
 class ObjectTracker:
+    INPUT_SIZE = (416, 416)
+    TRACKER_FACTORIES = {
+        "csrt": lambda: cv2.TrackerCSRT_create(),
+        "kcf": lambda: cv2.TrackerKCF_create(),
+        "mosse": lambda: cv2.legacy.TrackerMOSSE_create()
+    }
+    
     def __init__(self):
         self.device = torch.device("cuda" if settings.USE_GPU and torch.cuda.is_available() else "cpu")
         self.model = self._load_model()
-        self.tracker = cv2.TrackerCSRT_create
-        self.active_tracks: Dict[int, cv2.Tracker] = {}
-        self.track_history: Dict[int, List[Tuple[float, float]]] = {}
+        # Resolve the YOLO output layers once instead of on every frame
+        layer_names = self.model.getLayerNames()
+        self.output_layers = [layer_names[i - 1] for i in np.asarray(self.model.getUnconnectedOutLayers()).flatten()]
+        self.model_version = (f"yolov3-{self.INPUT_SIZE[0]}-c{settings.DETECTION_CONFIDENCE_THRESHOLD}"
+                              f"-nms{settings.DETECTION_NMS_THRESHOLD}")
+        self.tracker = self.TRACKER_FACTORIES.get(settings.TRACKER_TYPE.lower(), self.TRACKER_FACTORIES["kcf"])
+        # Live and recently lost tracks; histories are indexed by frame, NaN where the object was absent
+        self.tracks: Dict[int, Track] = {}
         self.next_track_id = 0
+        self.frame_index = 0
+        # Frames left until the detector runs again; 0 means the next frame is detected
+        self.frames_until_detection = 0
+        # Detections keyed by frame timestamp, shared with the on-disk feature cache
+        self.detection_cache: Dict[float, List[Dict]] = {}
         
     def _load_model(self) -> cv2.dnn.Net:
         """Load YOLO model for object detection."""
@@ -49,93 +78,194 @@ class ObjectTracker:
             str(Path(settings.MODEL_CACHE_DIR) / "yolov3.cfg")
         )
     
-    def detect_objects(self, frame: np.ndarray) -> List[Dict]:
-        """Detect objects in a frame using YOLO."""
-        height, width = frame.shape[:2]
+    def detect_objects(self, frame: np.ndarray, timestamp: Optional[float] = None) -> List[Dict]:
+        """Detect objects in a frame using YOLO.
         
-        # Prepare image for YOLO
-        blob = cv2.dnn.blobFromImage(frame, 1/255.0, (416, 416), swapRB=True, crop=False)
+        When a timestamp is given, results are looked up in and added to
+        `detection_cache`, so re-runs on the same footage skip inference.
+        """
+        return self.detect_objects_batch([frame], None if timestamp is None else [timestamp])[0]
+    
+    def detect_objects_batch(self, frames: Sequence[np.ndarray],
+                             timestamps: Optional[Sequence[float]] = None) -> List[List[Dict]]:
+        """Detect objects in several frames, DETECTION_BATCH_SIZE frames per forward pass."""
+        results: List[Optional[List[Dict]]] = [None] * len(frames)
+        keys = [None] * len(frames) if timestamps is None else [round(float(t), 3) for t in timestamps]
         
-        # Run inference
-        self.model.setInput(blob)
-        layer_names = self.model.getLayerNames()
-        output_layers = [layer_names[i - 1] for i in self.model.getUnconnectedOutLayers()]
-        outputs = self.model.forward(output_layers)
-        
-        # Process detections
-        detections = []
-        for output in outputs:
-            for detection in output:
-                scores = detection[5:]
-                class_id = np.argmax(scores)
-                confidence = scores[class_id]
-                
-                if confidence > 0.5:  # Confidence threshold
-                    center_x = int(detection[0] * width)
-                    center_y = int(detection[1] * height)
-                    w = int(detection[2] * width)
-                    h = int(detection[3] * height)
-                    
-                    x = int(center_x - w/2)
-                    y = int(center_y - h/2)
-                    
-                    detections.append({
-                        "bbox": (x, y, w, h),
-                        "confidence": float(confidence),
-                        "class_id": int(class_id)
-                    })
-        
-        return detections
-    
-    def update_tracks(self, frame: np.ndarray) -> List[Dict]:
-        """Update object tracks and return tracking information."""
-        # Detect new objects
-        detections = self.detect_objects(frame)
+        # Only frames missing from the detection cache go through the network
+        pending = []
+        for i, key in enumerate(keys):
+            if key is not None and key in self.detection_cache:
+                results[i] = self.detection_cache[key]
+            else:
+                pending.append(i)
+        
+        batch_size = settings.DETECTION_BATCH_SIZE
+        for start in range(0, len(pending), batch_size):
+            chunk = pending[start:start + batch_size]
+            
+            # Prepare images for YOLO and run inference
+            blob = cv2.dnn.blobFromImages([frames[i] for i in chunk], 1/255.0, self.INPUT_SIZE, swapRB=True, crop=False)
+            self.model.setInput(blob)
+            outputs = self.model.forward(self.output_layers)
+            
+            # OpenCV returns (rows, 85) per output layer for one image and
+            # (batch, rows, 85) for several
+            outputs = [output.reshape(len(chunk), -1, output.shape[-1]) for output in outputs]
+            for b, i in enumerate(chunk):
+                rows = np.concatenate([output[b] for output in outputs])
+                results[i] = self._decode_detections(rows, frames[i].shape[:2])
+                if keys[i] is not None:
+                    self.detection_cache[keys[i]] = results[i]
+        
+        return results
+    
+    def _decode_detections(self, rows: np.ndarray, frame_shape: Tuple[int, int]) -> List[Dict]:
+        """Threshold YOLO output rows and suppress overlapping boxes."""
+        height, width = frame_shape
+        
+        # Best class and its score for every row
+        scores = rows[:, 5:]
+        class_ids = np.argmax(scores, axis=1)
+        confidences = scores[np.arange(len(rows)), class_ids]
+        keep = confidences > settings.DETECTION_CONFIDENCE_THRESHOLD
+        rows, class_ids, confidences = rows[keep], class_ids[keep], confidences[keep]
+        if not len(rows):
+            return []
+        
+        # Convert relative centers and sizes to pixel (x, y, w, h) boxes
+        center_x = (rows[:, 0] * width).astype(np.int64)
+        center_y = (rows[:, 1] * height).astype(np.int64)
+        w = (rows[:, 2] * width).astype(np.int64)
+        h = (rows[:, 3] * height).astype(np.int64)
+        boxes = np.stack([(center_x - w / 2).astype(np.int64), (center_y - h / 2).astype(np.int64), w, h], axis=1)
+        
+        # Per-class non-maximum suppression
+        indices = cv2.dnn.NMSBoxesBatched(
+            boxes.tolist(), confidences.tolist(), class_ids.tolist(),
+            settings.DETECTION_CONFIDENCE_THRESHOLD, settings.DETECTION_NMS_THRESHOLD
+        )
+        
+        return [
+            {
+                "bbox": tuple(int(v) for v in boxes[i]),
+                "confidence": float(confidences[i]),
+                "class_id": int(class_ids[i])
+            }
+            for i in np.asarray(indices, dtype=np.int64).flatten()
+        ]
+    
+    def reset(self):
+        """Drop all tracks, e.g. at a scene cut; cached detections are kept."""
+        self.tracks = {}
+        self.next_track_id = 0
+        self.frame_index = 0
+        self.frames_until_detection = 0
+    
+    def scheduled_detections(self, num_frames: int) -> List[bool]:
+        """Predict which of the next frames will run the detector.
+        
+        Re-detections triggered by lost tracks are not known in advance;
+        update_tracks runs the detector for those on demand.
+        """
+        interval = max(1, settings.DETECTION_INTERVAL)
+        return [
+            i >= self.frames_until_detection and (i - self.frames_until_detection) % interval == 0
+            for i in range(num_frames)
+        ]
+    
+    def update_tracks(self, frame: np.ndarray, timestamp: Optional[float] = None,
+                      detections: Optional[List[Dict]] = None) -> List[Dict]:
+        """Update object tracks and return tracking information.
         
+        The detector only runs every DETECTION_INTERVAL frames; in between,
+        objects are propagated by their trackers. A lost track triggers an
+        immediate re-detection. Detections computed ahead of time (e.g. by
+        detect_objects_batch) are used when the frame is due for detection.
+        """
         # Update existing tracks
-        active_tracks = {}
         track_info = []
+        lost_tracks = 0
         
-        for track_id, tracker in self.active_tracks.items():
-            success, bbox = tracker.update(frame)
-            if success:
-                active_tracks[track_id] = tracker
-                self.track_history[track_id].append((bbox[0] + bbox[2]/2, bbox[1] + bbox[3]/2))
-                
-                track_info.append({
-                    "track_id": track_id,
-                    "bbox": bbox,
-                    "history": self.track_history[track_id]
-                })
+        for track in self.tracks.values():
+            if track.lost_frames:
+                track.lost_frames += 1
+                track.history[self.frame_index % len(track.history)] = np.nan
+                continue
+            
+            success, bbox = track.tracker.update(frame)
+            # Treat collapsed boxes like a failed update
+            if success and bbox[2] > 0 and bbox[3] > 0:
+                self._record_position(track, bbox)
+                track_info.append({"track_id": track.track_id, "bbox": bbox})
+            else:
+                track.tracker = None
+                track.lost_frames = 1
+                track.history[self.frame_index % len(track.history)] = np.nan
+                lost_tracks += 1
+        
+        if self.frames_until_detection > 0 and not lost_tracks:
+            self.frames_until_detection -= 1
+            self._evict_lost_tracks()
+            self.frame_index += 1
+            return track_info
+        
+        # Detect new objects
+        if detections is None:
+            detections = self.detect_objects(frame, timestamp)
+        self.frames_until_detection = max(1, settings.DETECTION_INTERVAL) - 1
         
         # Initialize new tracks
+        tracked_bboxes = [info["bbox"] for info in track_info]
         for detection in detections:
             # Check if detection overlaps with existing tracks
-            is_new = True
-            for track_id in active_tracks:
-                if self._calculate_iou(detection["bbox"], track_info[track_id]["bbox"]) > 0.3:
-                    is_new = False
-                    break
+            if any(self._calculate_iou(detection["bbox"], bbox) > 0.3 for bbox in tracked_bboxes):
+                continue
             
-            if is_new:
-                tracker = self.tracker()
-                tracker.init(frame, detection["bbox"])
-                active_tracks[self.next_track_id] = tracker
-                self.track_history[self.next_track_id] = [(detection["bbox"][0] + detection["bbox"][2]/2,
-                                                          detection["bbox"][1] + detection["bbox"][3]/2)]
-                
-                track_info.append({
-                    "track_id": self.next_track_id,
-                    "bbox": detection["bbox"],
-                    "history": self.track_history[self.next_track_id]
-                })
+            # Resume a recently lost track found again at the same place
+            track = self._match_lost_track(detection["bbox"])
+            if track is None:
+                track = Track(self.next_track_id, settings.TRACK_HISTORY_LENGTH)
+                self.tracks[track.track_id] = track
                 self.next_track_id += 1
+            
+            track.tracker = self.tracker()
+            track.tracker.init(frame, detection["bbox"])
+            track.lost_frames = 0
+            self._record_position(track, detection["bbox"])
+            track_info.append({"track_id": track.track_id, "bbox": detection["bbox"]})
         
-        # Update active tracks
-        self.active_tracks = active_tracks
+        self._evict_lost_tracks()
+        self.frame_index += 1
         
         return track_info
     
+    def _record_position(self, track: Track, bbox: Tuple[float, float, float, float]):
+        """Store a track's box and its center in the history slot of the current frame."""
+        track.bbox = bbox
+        track.history[self.frame_index % len(track.history)] = (bbox[0] + bbox[2]/2, bbox[1] + bbox[3]/2)
+    
+    def _match_lost_track(self, bbox: Tuple[float, float, float, float]) -> Optional[Track]:
+        """Find a lost track whose last box overlaps the given one."""
+        for track in self.tracks.values():
+            if track.lost_frames and self._calculate_iou(bbox, track.bbox) > 0.3:
+                return track
+        return None
+    
+    def _evict_lost_tracks(self):
+        """Forget tracks that have been lost for more than TRACK_MAX_LOST_FRAMES frames."""
+        expired = [track_id for track_id, track in self.tracks.items()
+                   if track.lost_frames > settings.TRACK_MAX_LOST_FRAMES]
+        for track_id in expired:
+            del self.tracks[track_id]
+    
+    def _ordered_histories(self, track_info: List[Dict]) -> np.ndarray:
+        """Stack track histories into a (tracks, frames, 2) array, oldest frame first."""
+        histories = np.stack([self.tracks[track["track_id"]].history for track in track_info])
+        # The slot after the latest frame holds the oldest one
+        order = (self.frame_index + np.arange(histories.shape[1])) % histories.shape[1]
+        return histories[:, order]
+    
     def _calculate_iou(self, bbox1: Tuple[float, float, float, float],
                       bbox2: Tuple[float, float, float, float]) -> float:
         """Calculate Intersection over Union between two bounding boxes."""
@@ -169,27 +299,24 @@ class ObjectTracker:
                 "object_interaction": 0.0
             }
         
-        # Calculate motion complexity
-        motion_vectors = []
-        for track in track_info:
-            history = track["history"]
-            if len(history) >= 2:
-                for i in range(1, len(history)):
-                    dx = history[i][0] - history[i-1][0]
-                    dy = history[i][1] - history[i-1][1]
-                    motion_vectors.append((dx, dy))
-        
-        if motion_vectors:
+        positions = self._ordered_histories(track_info)
+        
+        # Motion vectors between consecutive frames, valid where a track was present in both
+        motion_vectors = np.diff(positions, axis=1)
+        valid = ~np.isnan(motion_vectors).any(axis=2)
+        
+        if valid.any():
             # Calculate motion complexity (variance in motion vectors)
-            motion_complexity = np.var([np.sqrt(dx*dx + dy*dy) for dx, dy in motion_vectors])
+            speeds = np.hypot(motion_vectors[..., 0], motion_vectors[..., 1])
+            motion_complexity = np.var(speeds[valid])
             
             # Calculate motion smoothness (variance in direction changes)
-            directions = [np.arctan2(dy, dx) for dx, dy in motion_vectors]
-            direction_changes = np.diff(directions)
-            motion_smoothness = 1 / (1 + np.var(direction_changes))
+            directions = np.arctan2(motion_vectors[..., 1], motion_vectors[..., 0])
+            direction_changes = np.diff(directions, axis=1)[valid[:, 1:] & valid[:, :-1]]
+            motion_smoothness = 1 / (1 + np.var(direction_changes)) if direction_changes.size else 1.0
             
             # Calculate object interaction (proximity between objects)
-            object_interaction = self._calculate_object_interaction(track_info)
+            object_interaction = self._calculate_object_interaction(track_info, positions)
             
             return {
                 "motion_complexity": float(motion_complexity),
@@ -203,22 +330,21 @@ class ObjectTracker:
             "object_interaction": 0.0
         }
     
-    def _calculate_object_interaction(self, track_info: List[Dict]) -> float:
+    def _calculate_object_interaction(self, track_info: List[Dict],
+                                      positions: Optional[np.ndarray] = None) -> float:
         """Calculate the level of interaction between objects."""
         if len(track_info) < 2:
             return 0.0
+        if positions is None:
+            positions = self._ordered_histories(track_info)
+        
+        # Distances between every pair of object centers in every frame both were tracked
+        offsets = positions[:, None] - positions[None, :]
+        distances = np.hypot(offsets[..., 0], offsets[..., 1])
+        min_dist = np.where(np.isnan(distances), np.inf, distances).min(axis=2)
+        
+        # Convert distance to interaction score (closer = higher interaction)
+        pairs = np.triu_indices(len(track_info), k=1)
+        interactions = 1 / (1 + min_dist[pairs]/100)  # Normalize by typical frame size
         
-        interactions = []
-        for i, track1 in enumerate(track_info):
-            for track2 in track_info[i+1:]:
-                # Calculate minimum distance between object centers
-                min_dist = float('inf')
-                for pos1, pos2 in zip(track1["history"], track2["history"]):
-                    dist = np.sqrt((pos1[0] - pos2[0])**2 + (pos1[1] - pos2[1])**2)
-                    min_dist = min(min_dist, dist)
-                
-                # Convert distance to interaction score (closer = higher interaction)
-                interaction = 1 / (1 + min_dist/100)  # Normalize by typical frame size
-                interactions.append(interaction)
-        
-        return float(np.mean(interactions)) if interactions else 0.0 
\ No newline at end of file
+        return float(np.mean(interactions))
@@ -1,24 +1,34 @@
 import torch
 import torch.nn as nn
+import torch.nn.functional as F
 import torchvision.models as models
-import torchvision.transforms as transforms
-from typing import List, Tuple, Dict
+from typing import List, Tuple, Dict, Iterable, Iterator, Optional, Sequence, Union
 import numpy as np
-from PIL import Image
 import cv2
-from sklearn.cluster import KMeans
+from sklearn.cluster import MiniBatchKMeans
 from app.core.config import settings
 from app.models.object_tracker import ObjectTracker
 
 class SceneAnalyzer:
+    FEATURE_DIM = 2048
+    INPUT_SIZE = (224, 224)
+    # Cheap pre-filter signature: HSV histogram and grayscale thumbnail of a downscaled frame
+    PREFILTER_SIZE = (64, 36)
+    PREFILTER_HIST_BINS = [8, 4, 4]
+    PREFILTER_THUMBNAIL_SIZE = (16, 9)
+    
     def __init__(self):
         self.device = torch.device("cuda" if settings.USE_GPU and torch.cuda.is_available() else "cpu")
+        # Half precision uses float16 on GPU and bfloat16, the CPU half type, otherwise
+        if settings.FEATURE_HALF_PRECISION:
+            self.dtype = torch.float16 if self.device.type == "cuda" else torch.bfloat16
+        else:
+            self.dtype = torch.float32
+        self.memory_format = torch.channels_last if settings.FEATURE_CHANNELS_LAST else torch.contiguous_format
+        self.model_version = f"resnet50-imagenet1k-v1-{str(self.dtype).split('.')[-1]}"
         self.model = self._load_model()
-        self.transform = transforms.Compose([
-            transforms.Resize((224, 224)),
-            transforms.ToTensor(),
-            transforms.Normalize(mean=[0.485, 0.456, 0.406], std=[0.229, 0.224, 0.225])
-        ])
+        self.mean = torch.tensor([0.485, 0.456, 0.406], device=self.device).view(1, 3, 1, 1)
+        self.std = torch.tensor([0.229, 0.224, 0.225], device=self.device).view(1, 3, 1, 1)
         self.object_tracker = ObjectTracker()
         
     def _load_model(self) -> nn.Module:
@@ -27,43 +37,160 @@ class SceneAnalyzer:
         # Remove the final classification layer
         model = nn.Sequential(*list(model.children())[:-1])
         model.eval()
-        return model.to(self.device)
+        return model.to(self.device, dtype=self.dtype, memory_format=self.memory_format)
     
     def extract_features(self, frame: np.ndarray) -> np.ndarray:
         """Extract deep features from a frame."""
-        # Convert frame to PIL Image
-        frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-        pil_image = Image.fromarray(frame_rgb)
+        return self.extract_features_batch([frame])[0]
+    
+    def extract_features_batch(self, frames: Sequence[np.ndarray], batch_size: Optional[int] = None) -> np.ndarray:
+        """Extract deep features for a sequence of same-sized BGR frames.
+        
+        Returns an (N, 2048) float32 array. Frames are run through the model
+        `batch_size` at a time (defaults to settings.FEATURE_BATCH_SIZE).
+        """
+        batch_size = batch_size or settings.FEATURE_BATCH_SIZE
+        if len(frames) == 0:
+            return np.empty((0, self.FEATURE_DIM), dtype=np.float32)
+        
+        outputs = []
+        with torch.inference_mode():
+            for start in range(0, len(frames), batch_size):
+                input_tensor = self._preprocess(frames[start:start + batch_size])
+                features = self.model(input_tensor)
+                outputs.append(features.flatten(1).float().cpu().numpy())
+        
+        return np.concatenate(outputs)
+    
+    def _preprocess(self, frames: Sequence[np.ndarray]) -> torch.Tensor:
+        """Resize and normalize a stack of BGR frames as batched tensor operations."""
+        # (N, H, W, C) uint8 -> NCHW view that is already channels_last in memory
+        batch = torch.from_numpy(np.stack(frames)).to(self.device).permute(0, 3, 1, 2)
         
-        # Transform and add batch dimension
-        input_tensor = self.transform(pil_image).unsqueeze(0).to(self.device)
+        # CPU kernels resize uint8 directly; other devices need float input
+        if batch.device.type != "cpu":
+            batch = batch.float()
+        batch = F.interpolate(batch, size=self.INPUT_SIZE, mode="bilinear", align_corners=False, antialias=True)
         
-        # Extract features
-        with torch.no_grad():
-            features = self.model(input_tensor)
+        # BGR -> RGB, scale to [0, 1] and normalize
+        batch = batch.flip(1).float().div_(255.0)
+        batch = (batch - self.mean) / self.std
         
-        # Flatten and convert to numpy
-        return features.squeeze().cpu().numpy()
+        return batch.to(dtype=self.dtype, memory_format=self.memory_format)
     
-    def detect_scenes(self, frames: List[np.ndarray], threshold: float = 0.5) -> List[Tuple[int, int]]:
-        """Detect scene changes using deep features."""
+    def detect_scenes(self, frames: List[np.ndarray], threshold: float = 0.5,
+                      adaptive: bool = False) -> List[Tuple[int, int]]:
+        """Detect scenes as (start, end) frame index intervals, end exclusive."""
         if not frames:
             return []
         
-        # Extract features for all frames
-        features = [self.extract_features(frame) for frame in frames]
-        
-        # Calculate cosine similarity between consecutive frames
-        scenes = []
-        for i in range(len(features) - 1):
-            similarity = np.dot(features[i], features[i + 1]) / (
-                np.linalg.norm(features[i]) * np.linalg.norm(features[i + 1])
+        # Only frames around candidate pairs flagged by the cheap pre-filter
+        # go through the deep model; the other pairs count as identical
+        if settings.SCENE_PREFILTER:
+            signatures = np.stack([self.frame_signature(frame) for frame in frames])
+            candidates = np.flatnonzero(self.signature_distances(signatures) >= settings.SCENE_PREFILTER_THRESHOLD)
+        else:
+            candidates = np.arange(len(frames) - 1)
+        
+        similarities = np.ones(len(frames) - 1, dtype=np.float32)
+        if len(candidates):
+            needed = np.union1d(candidates, candidates + 1)
+            features = self.extract_features_batch([frames[i] for i in needed])
+            similarities[candidates] = self.pairwise_similarities(
+                features[np.searchsorted(needed, candidates)],
+                features[np.searchsorted(needed, candidates + 1)]
             )
-            
-            if similarity < threshold:
-                scenes.append((i, i + 1))
         
-        return scenes
+        thresholds = self.boundary_thresholds(similarities, threshold, adaptive)
+        boundaries = np.flatnonzero(similarities < thresholds) + 1
+        return self.boundaries_to_intervals(boundaries, len(frames))
+    
+    def detect_boundaries(self, features: np.ndarray, threshold: float = 0.5,
+                          adaptive: bool = False) -> np.ndarray:
+        """Return the indices of samples that start a new scene.
+        
+        Works on the whole (N, D) embedding matrix at once, so boundaries for
+        an hour of samples take milliseconds once the features exist.
+        """
+        similarities = self.consecutive_similarities(features)
+        thresholds = self.boundary_thresholds(similarities, threshold, adaptive)
+        return np.flatnonzero(similarities < thresholds) + 1
+    
+    def consecutive_similarities(self, features: np.ndarray) -> np.ndarray:
+        """Cosine similarity between every pair of consecutive feature vectors."""
+        features = np.asarray(features, dtype=np.float32)
+        if len(features) < 2:
+            return np.empty(0, dtype=np.float32)
+        
+        return self.pairwise_similarities(features[:-1], features[1:])
+    
+    def pairwise_similarities(self, features_a: np.ndarray, features_b: np.ndarray) -> np.ndarray:
+        """Row-wise cosine similarity between two (N, D) feature matrices."""
+        features_a = np.asarray(features_a, dtype=np.float32)
+        features_b = np.asarray(features_b, dtype=np.float32)
+        norms = np.linalg.norm(features_a, axis=1) * np.linalg.norm(features_b, axis=1)
+        return np.einsum("ij,ij->i", features_a, features_b) / np.maximum(norms, 1e-12)
+    
+    def frame_signature(self, frame: np.ndarray) -> np.ndarray:
+        """Cheap appearance signature used to skip the deep model on near-identical frames."""
+        small = cv2.resize(frame, self.PREFILTER_SIZE, interpolation=cv2.INTER_AREA)
+        
+        # Colour distribution
+        hsv = cv2.cvtColor(small, cv2.COLOR_BGR2HSV)
+        hist = cv2.calcHist([hsv], [0, 1, 2], None, self.PREFILTER_HIST_BINS, [0, 180, 0, 256, 0, 256]).flatten()
+        hist /= max(float(hist.sum()), 1.0)
+        
+        # Coarse layout, so cuts between similarly coloured shots are not missed
+        gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+        thumbnail = cv2.resize(gray, self.PREFILTER_THUMBNAIL_SIZE, interpolation=cv2.INTER_AREA).flatten() / 255.0
+        
+        return np.concatenate([hist, thumbnail]).astype(np.float32)
+    
+    def signature_distances(self, signatures: np.ndarray) -> np.ndarray:
+        """Change score in [0, 1] between consecutive frame signatures."""
+        signatures = np.asarray(signatures, dtype=np.float32)
+        if len(signatures) < 2:
+            return np.empty(0, dtype=np.float32)
+        
+        bins = int(np.prod(self.PREFILTER_HIST_BINS))
+        diffs = np.abs(np.diff(signatures, axis=0))
+        hist_distance = 0.5 * diffs[:, :bins].sum(axis=1)  # Total variation distance
+        layout_distance = diffs[:, bins:].mean(axis=1)
+        return np.maximum(hist_distance, layout_distance)
+    
+    def boundary_thresholds(self, similarities: np.ndarray, threshold: float = 0.5,
+                            adaptive: bool = False) -> np.ndarray:
+        """Per-pair cut thresholds for a sequence of consecutive similarities.
+        
+        With `adaptive`, a pair is also a cut when its similarity falls well
+        below the preceding SCENE_ADAPTIVE_WINDOW similarities (robust median
+        minus SCENE_ADAPTIVE_K spreads). Only past values are used, so the
+        result is the same whether similarities arrive one by one or at once.
+        """
+        similarities = np.asarray(similarities, dtype=np.float32)
+        thresholds = np.full(len(similarities), threshold, dtype=np.float32)
+        window = settings.SCENE_ADAPTIVE_WINDOW
+        if not adaptive or len(similarities) <= window:
+            return thresholds
+        
+        windows = np.lib.stride_tricks.sliding_window_view(similarities[:-1], window)
+        median = np.median(windows, axis=1)
+        spread = 1.4826 * np.median(np.abs(windows - median[:, None]), axis=1)
+        spread = np.maximum(spread, settings.SCENE_ADAPTIVE_MIN_SPREAD)
+        thresholds[window:] = np.maximum(threshold, median - settings.SCENE_ADAPTIVE_K * spread)
+        return thresholds
+    
+    def boundaries_to_intervals(self, boundaries: Iterable[int], num_samples: int) -> List[Tuple[int, int]]:
+        """Turn scene start indices into (start, end) intervals covering all samples."""
+        starts = [0] + [int(b) for b in boundaries if 0 < b < num_samples]
+        ends = starts[1:] + [num_samples]
+        return list(zip(starts, ends))
+    
+    def feature_similarity(self, features_a: np.ndarray, features_b: np.ndarray) -> float:
+        """Cosine similarity between two feature vectors."""
+        return float(np.dot(features_a, features_b) / max(
+            np.linalg.norm(features_a) * np.linalg.norm(features_b), 1e-12
+        ))
     
     def analyze_scene_content(self, frame: np.ndarray) -> Dict[str, float]:
         """Analyze the content of a scene (e.g., motion, composition, lighting)."""
@@ -112,32 +239,57 @@ class SceneAnalyzer:
             return []
         
         # Extract features for all frames
-        features = [self.extract_features(frame) for frame in frames]
+        features = self.extract_features_batch(frames)
         
-        # Calculate pairwise distances between frames
-        distances = np.zeros((len(frames), len(frames)))
-        for i in range(len(frames)):
-            for j in range(i + 1, len(frames)):
-                dist = np.linalg.norm(features[i] - features[j])
-                distances[i, j] = dist
-                distances[j, i] = dist
+        return self.select_keyframes(features, num_keyframes)
+    
+    def select_keyframes(self, features: np.ndarray, num_keyframes: int = 5) -> List[int]:
+        """Select the most representative samples from precomputed features.
+        
+        Clusters the (N, D) embeddings directly with mini-batch k-means and
+        picks the sample closest to each cluster center, so time and memory
+        grow linearly with N.
+        """
+        features = np.asarray(features, dtype=np.float32)
+        if len(features) == 0:
+            return []
+        
+        # Cluster distinct embeddings only; static footage repeats them a lot
+        unique_features, first_index = np.unique(features, axis=0, return_index=True)
+        num_clusters = min(num_keyframes, len(unique_features))
+        if num_clusters == len(unique_features):
+            return sorted(int(i) for i in first_index)
         
         # Use k-means clustering to select diverse keyframes
-        kmeans = KMeans(n_clusters=min(num_keyframes, len(frames)), random_state=42)
-        clusters = kmeans.fit_predict(distances)
+        kmeans = MiniBatchKMeans(n_clusters=num_clusters, random_state=42, n_init=3,
+                                 batch_size=min(1024, len(unique_features)))
+        clusters = kmeans.fit_predict(unique_features)
+        
+        # Squared distances of every sample to every center, (N, K)
+        centers = kmeans.cluster_centers_.astype(np.float32)
+        distances = (
+            np.sum(unique_features ** 2, axis=1, keepdims=True)
+            - 2 * unique_features @ centers.T
+            + np.sum(centers ** 2, axis=1)
+        )
         
-        # Select frames closest to cluster centers
-        keyframes = []
-        for i in range(kmeans.n_clusters):
-            cluster_frames = np.where(clusters == i)[0]
-            center = kmeans.cluster_centers_[i]
-            closest_frame = cluster_frames[np.argmin(distances[cluster_frames, center])]
-            keyframes.append(closest_frame)
+        # Select frames closest to their own cluster center
+        distances[clusters[:, None] != np.arange(num_clusters)] = np.inf
+        closest = np.argmin(distances, axis=0)
+        closest = closest[np.isfinite(distances[closest, np.arange(num_clusters)])]
         
-        return sorted(keyframes)
+        return sorted(int(first_index[i]) for i in closest)
     
-    def analyze_scene_quality(self, frame: np.ndarray) -> Dict[str, float]:
-        """Analyze the technical quality of a scene."""
+    def analyze_scene_quality(self, frames: Union[np.ndarray, Iterable[np.ndarray]]) -> Dict[str, float]:
+        """Analyze the technical quality of a scene.
+        
+        Accepts a single frame, or any iterable of frames (e.g. a FrameSampleBuffer),
+        in which case the metrics are averaged over the frames one at a time.
+        """
+        return self._mean_metrics(self._frame_quality(frame) for frame in self._iter_frames(frames))
+    
+    def _frame_quality(self, frame: np.ndarray) -> Dict[str, float]:
+        """Quality metrics of a single frame."""
         # Calculate sharpness using Laplacian variance
         gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
         laplacian = cv2.Laplacian(gray, cv2.CV_64F)
@@ -161,35 +313,79 @@ class SceneAnalyzer:
             "exposure": float(exposure)
         }
     
-    def track_motion(self, frames: List[np.ndarray]) -> List[Dict[str, float]]:
-        """Track motion between consecutive frames using object tracking."""
-        if len(frames) < 2:
-            return []
-        
+    def track_motion(self, frames: Iterable[np.ndarray]) -> List[Dict[str, float]]:
+        """Track motion between consecutive frames of one scene using object tracking.
+        
+        Frames are consumed DETECTION_BATCH_SIZE at a time, so a generator or
+        frame buffer can be passed without materializing the whole scene.
+        Tracks from earlier calls are dropped first.
+        """
+        self.object_tracker.reset()
         motion_data = []
+        batch = []
         for frame in frames:
-            # Update object tracks
-            track_info = self.object_tracker.update_tracks(frame)
-            
-            # Analyze motion patterns
-            motion_patterns = self.object_tracker.analyze_motion_patterns(track_info)
-            
-            motion_data.append({
-                "magnitude": motion_patterns["motion_complexity"],
-                "direction": motion_patterns["motion_smoothness"],
-                "variance": motion_patterns["object_interaction"],
-                "num_objects": len(track_info)
-            })
+            batch.append(frame)
+            if len(batch) == settings.DETECTION_BATCH_SIZE:
+                motion_data.extend(self.track_frames_motion(batch))
+                batch = []
+        motion_data.extend(self.track_frames_motion(batch))
+        
+        if len(motion_data) < 2:
+            return []
         
         return motion_data
     
-    def calculate_scene_importance(self, frame: np.ndarray, motion_data: List[Dict[str, float]] = None) -> float:
-        """Calculate the importance score of a scene."""
-        # Get content analysis
-        content = self.analyze_scene_content(frame)
+    def track_frames_motion(self, frames: Sequence[np.ndarray],
+                            timestamps: Optional[Sequence[float]] = None) -> List[Dict[str, float]]:
+        """Track a run of consecutive frames, batching the detector over the frames due for detection."""
+        if not frames:
+            return []
         
-        # Get quality analysis
-        quality = self.analyze_scene_quality(frame)
+        # Only frames on the detection cadence go through YOLO
+        scheduled = self.object_tracker.scheduled_detections(len(frames))
+        indices = [i for i, due in enumerate(scheduled) if due]
+        detections: List[Optional[List[Dict]]] = [None] * len(frames)
+        batch = self.object_tracker.detect_objects_batch(
+            [frames[i] for i in indices],
+            None if timestamps is None else [timestamps[i] for i in indices]
+        )
+        for i, frame_detections in zip(indices, batch):
+            detections[i] = frame_detections
+        
+        if timestamps is None:
+            timestamps = [None] * len(frames)
+        return [
+            self.track_frame_motion(frame, timestamp, frame_detections)
+            for frame, timestamp, frame_detections in zip(frames, timestamps, detections)
+        ]
+    
+    def track_frame_motion(self, frame: np.ndarray, timestamp: Optional[float] = None,
+                           detections: Optional[List[Dict]] = None) -> Dict[str, float]:
+        """Update object tracks with one frame and summarize the motion so far."""
+        # Update object tracks
+        track_info = self.object_tracker.update_tracks(frame, timestamp, detections)
+        
+        # Analyze motion patterns
+        motion_patterns = self.object_tracker.analyze_motion_patterns(track_info)
+        
+        return {
+            "magnitude": motion_patterns["motion_complexity"],
+            "direction": motion_patterns["motion_smoothness"],
+            "variance": motion_patterns["object_interaction"],
+            "num_objects": len(track_info)
+        }
+    
+    def calculate_scene_importance(self, frames: Union[np.ndarray, Iterable[np.ndarray]],
+                                   motion_data: List[Dict[str, float]] = None) -> float:
+        """Calculate the importance score of a scene from one frame or an iterable of frames."""
+        # Get content and quality analysis in a single pass over the frames
+        contents = []
+        qualities = []
+        for frame in self._iter_frames(frames):
+            contents.append(self.analyze_scene_content(frame))
+            qualities.append(self._frame_quality(frame))
+        content = self._mean_metrics(contents)
+        quality = self._mean_metrics(qualities)
         
         # Calculate base importance score
         importance = (
@@ -218,13 +414,17 @@ class SceneAnalyzer:
         
         return float(np.clip(importance, 0, 1))
     
-    def analyze_scene_continuity(self, frames: List[np.ndarray]) -> Dict[str, float]:
-        """Analyze the continuity between frames in a scene."""
-        if len(frames) < 2:
-            return {"continuity_score": 0.0, "motion_consistency": 0.0}
-        
-        # Track motion with object tracking
-        motion_data = self.track_motion(frames)
+    def analyze_scene_continuity(self, frames: Optional[Iterable[np.ndarray]] = None,
+                                 motion_data: Optional[List[Dict[str, float]]] = None) -> Dict[str, float]:
+        """Analyze the continuity between frames in a scene.
+        
+        Pass the scene's motion data if it was already tracked; frames are
+        only tracked when it is missing.
+        """
+        if motion_data is None:
+            motion_data = self.track_motion(frames if frames is not None else [])
+        if not motion_data:
+            return {"continuity_score": 0.0, "motion_consistency": 0.0, "object_continuity": 0.0}
         
         # Calculate motion consistency
         motion_directions = [m["direction"] for m in motion_data]
@@ -246,4 +446,22 @@ class SceneAnalyzer:
             "continuity_score": float(continuity_score),
             "motion_consistency": float(motion_consistency),
             "object_continuity": float(object_continuity)
-        } 
\ No newline at end of file
+        }
+    
+    def _iter_frames(self, frames: Union[np.ndarray, Iterable[np.ndarray]]) -> Iterator[np.ndarray]:
+        """Yield frames from a single frame, a frame stack or any frame iterable."""
+        if isinstance(frames, np.ndarray) and frames.ndim == 3:
+            yield frames
+        else:
+            yield from frames
+    
+    def _mean_metrics(self, metrics: Iterable[Dict[str, float]]) -> Dict[str, float]:
+        """Average metric dictionaries without keeping them around."""
+        totals: Dict[str, float] = {}
+        count = 0
+        for entry in metrics:
+            for key, value in entry.items():
+                totals[key] = totals.get(key, 0.0) + value
+            count += 1
+        
+        return {key: float(value / count) for key, value in totals.items()}
\ No newline at end of file
@@ -2,31 +2,43 @@ import torch
 import torch.nn as nn
 import torch.nn.functional as F
 import torchvision.models as models
-import torchvision.transforms as transforms
-from typing import Dict, Optional
+from typing import Dict, List, Optional, Sequence, Tuple
 import numpy as np
-from PIL import Image
 import cv2
 from app.core.config import settings
 
 class StyleTransfer:
+    # Rec. 709 luma weights for RGB
+    LUMA_WEIGHTS = np.array([0.2126, 0.7152, 0.0722], dtype=np.float32)
+    # VGG layers styled and matched by the neural mode
+    FEATURE_LAYERS = ['3', '8', '17']
+    STYLE_WEIGHT = 1e3
+    LEARNING_RATE = 0.02
+    # Fast guided filter used to bring neural results back to native resolution
+    GUIDED_RADIUS = 2
+    GUIDED_EPS = 1e-4
+    
     def __init__(self):
         self.device = torch.device("cuda" if settings.USE_GPU and torch.cuda.is_available() else "cpu")
-        self.model = self._load_model()
-        self.transform = transforms.Compose([
-            transforms.ToTensor(),
-            transforms.Normalize(mean=[0.485, 0.456, 0.406], std=[0.229, 0.224, 0.225])
-        ])
-        self.inverse_transform = transforms.Compose([
-            transforms.Normalize(mean=[-0.485/0.229, -0.456/0.224, -0.406/0.225],
-                              std=[1/0.229, 1/0.224, 1/0.225]),
-            transforms.ToPILImage()
-        ])
+        # VGG is only needed by the neural mode, so it is loaded on first use
+        self._model: Optional[nn.Module] = None
+        # Recently compiled LUTs keyed by (style, strength), least recently used first
+        self.luts: Dict[Tuple[str, float], np.ndarray] = {}
+        self.mean = torch.tensor([0.485, 0.456, 0.406], device=self.device).view(1, 3, 1, 1)
+        self.std = torch.tensor([0.229, 0.224, 0.225], device=self.device).view(1, 3, 1, 1)
         
+    @property
+    def model(self) -> nn.Module:
+        if self._model is None:
+            self._model = self._load_model()
+        return self._model
+    
     def _load_model(self) -> nn.Module:
         """Load a pre-trained VGG model for style transfer."""
         model = models.vgg19(pretrained=True).features
         model.eval()
+        # Only the image is optimized during reconstruction
+        model.requires_grad_(False)
         return model.to(self.device)
     
     def _get_features(self, image: torch.Tensor, model: nn.Module) -> Dict[str, torch.Tensor]:
@@ -36,8 +48,11 @@ class StyleTransfer:
         
         for name, layer in model._modules.items():
             x = layer(x)
-            if name in ['3', '8', '17', '26', '35']:  # Selected layers for style and content
+            if name in self.FEATURE_LAYERS:  # Selected layers for style and content
                 features[name] = x
+                # Deeper layers are never used
+                if len(features) == len(self.FEATURE_LAYERS):
+                    break
                 
         return features
     
@@ -54,16 +69,54 @@ class StyleTransfer:
                    style_name: str = "cinematic",
                    strength: float = 0.5) -> np.ndarray:
         """Apply a predefined style to the content image."""
-        # Convert numpy array to PIL Image
-        content_pil = Image.fromarray(cv2.cvtColor(content_image, cv2.COLOR_BGR2RGB))
+        if settings.STYLE_MODE != "neural":
+            return self.apply_lut(content_image, self.compile_lut(style_name, strength))
+        return self.apply_style_batch([content_image], style_name, strength)[0]
+    
+    def apply_style_batch(self,
+                          frames: Sequence[np.ndarray],
+                          style_name: str = "cinematic",
+                          strength: float = 0.5) -> List[np.ndarray]:
+        """Style a batch of same-sized RGB frames with the neural mode."""
+        transforms = self.style_transforms_batch(frames, style_name, strength)
+        return [self.apply_style_transform(frame, transform) for frame, transform in zip(frames, transforms)]
+    
+    def style_transforms_batch(self,
+                               frames: Sequence[np.ndarray],
+                               style_name: str = "cinematic",
+                               strength: float = 0.5) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """Neural style transforms of a batch of same-sized RGB frames.
         
-        # Transform content image
-        content_tensor = self.transform(content_pil).unsqueeze(0).to(self.device)
+        Frames are styled NEURAL_STYLE_BATCH_SIZE at a time at
+        NEURAL_STYLE_RESOLUTION. Each transform is the low-resolution (a, b)
+        coefficients of a per-channel local affine map (fast guided filter),
+        which apply_style_transform applies to a full-resolution frame.
+        """
+        if not len(frames):
+            return []
         
-        # Get style parameters based on preset
-        style_params = self._get_style_params(style_name)
+        # Downscale to the inference resolution
+        height, width = frames[0].shape[:2]
+        scale = min(1.0, settings.NEURAL_STYLE_RESOLUTION / max(height, width))
+        size = (max(1, round(width * scale)), max(1, round(height * scale)))
+        small = np.stack([cv2.resize(frame, size, interpolation=cv2.INTER_AREA) for frame in frames])
+        
+        style_params = self.get_grading_params(style_name)
+        transforms = []
+        batch_size = settings.NEURAL_STYLE_BATCH_SIZE
+        for start in range(0, len(frames), batch_size):
+            batch = small[start:start + batch_size]
+            styled = self._style_small(batch, style_params, strength)
+            for source, target in zip(batch, styled):
+                transforms.append(self._guided_coefficients(source.astype(np.float32) / 255, target))
+        
+        return transforms
+    
+    def _style_small(self, frames: np.ndarray, style_params: Dict, strength: float) -> np.ndarray:
+        """Style a (N, H, W, 3) uint8 stack, returning float RGB in [0, 1]."""
+        images = torch.from_numpy(frames).to(self.device).permute(0, 3, 1, 2).float().div_(255)
+        content_tensor = (images - self.mean) / self.std
         
-        # Apply style transfer
         with torch.no_grad():
             # Extract features
             content_features = self._get_features(content_tensor, self.model)
@@ -78,17 +131,132 @@ class StyleTransfer:
                 features = self._apply_contrast_brightness(features, style_params)
                 
                 styled_features[layer_name] = features
-            
-            # Reconstruct image
-            output = self._reconstruct_image(styled_features)
-            
-            # Blend with original based on strength
-            output = (1 - strength) * content_tensor + strength * output
         
-        # Convert back to numpy array
-        output_pil = self.inverse_transform(output.squeeze(0))
-        output_np = np.array(output_pil)
-        return cv2.cvtColor(output_np, cv2.COLOR_RGB2BGR)
+        # Reconstruct images
+        output = self._reconstruct_image(styled_features, content_tensor)
+        
+        # Blend with original based on strength
+        output = (1 - strength) * content_tensor + strength * output
+        output = (output * self.std + self.mean).clamp_(0, 1)
+        return output.permute(0, 2, 3, 1).cpu().numpy()
+    
+    def _guided_upsample(self, frame: np.ndarray, small: np.ndarray, styled: np.ndarray) -> np.ndarray:
+        """Apply the change from small to styled to the full-resolution frame."""
+        return self.apply_style_transform(frame, self._guided_coefficients(small, styled))
+    
+    def _guided_coefficients(self, small: np.ndarray, styled: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Fit the per-channel local affine map taking small to styled (fast guided filter)."""
+        ksize = (2 * self.GUIDED_RADIUS + 1, 2 * self.GUIDED_RADIUS + 1)
+        mean_i = cv2.boxFilter(small, -1, ksize)
+        mean_p = cv2.boxFilter(styled, -1, ksize)
+        cov_ip = cv2.boxFilter(small * styled, -1, ksize) - mean_i * mean_p
+        var_i = cv2.boxFilter(small * small, -1, ksize) - mean_i * mean_i
+        a = cov_ip / (var_i + self.GUIDED_EPS)
+        b = mean_p - a * mean_i
+        return cv2.boxFilter(a, -1, ksize), cv2.boxFilter(b, -1, ksize)
+    
+    def apply_style_transform(self, frame: np.ndarray, transform: Tuple[np.ndarray, np.ndarray]) -> np.ndarray:
+        """Apply low-resolution guided filter coefficients to a full-resolution frame.
+        
+        Works NEURAL_STYLE_TILE_ROWS rows at a time, so memory stays bounded
+        for large frames. Since the map is applied to the frame's own pixels,
+        a transform can be reused for nearly identical frames without
+        freezing their content.
+        """
+        a, b = transform
+        # Sample the coefficients at the center of every full-resolution pixel
+        height, width = frame.shape[:2]
+        small_height, small_width = a.shape[:2]
+        map_x = ((np.arange(width) + 0.5) * small_width / width - 0.5).astype(np.float32)
+        output = np.empty_like(frame)
+        for top in range(0, height, settings.NEURAL_STYLE_TILE_ROWS):
+            bottom = min(height, top + settings.NEURAL_STYLE_TILE_ROWS)
+            map_y = ((np.arange(top, bottom) + 0.5) * small_height / height - 0.5).astype(np.float32)
+            grid_x, grid_y = np.meshgrid(map_x, map_y)
+            band_a = cv2.remap(a, grid_x, grid_y, cv2.INTER_LINEAR, borderMode=cv2.BORDER_REPLICATE)
+            band_b = cv2.remap(b, grid_x, grid_y, cv2.INTER_LINEAR, borderMode=cv2.BORDER_REPLICATE)
+            band = frame[top:bottom].astype(np.float32) / 255
+            output[top:bottom] = np.clip((band_a * band + band_b) * 255 + 0.5, 0, 255).astype(np.uint8)
+        
+        return output
+    
+    def compile_lut(self, style_name: str = "cinematic", strength: float = 0.5) -> np.ndarray:
+        """Bake a style preset and its strength into a dense 3D LUT.
+        
+        The LUT has 2**LUT_BITS levels per channel and is flattened to one
+        packed RGBA uint32 per quantized RGB value, so a lookup is a single
+        gather. At the default 8 bits every input color has its own entry,
+        so smooth gradients grade exactly as per pixel, without banding.
+        The last LUT_CACHE_SIZE compiled LUTs are kept, so a preset in use
+        is only built once without tables piling up across jobs.
+        """
+        key = (style_name, round(float(strength), 3))
+        lut = self.luts.pop(key, None)
+        if lut is not None:
+            self.luts[key] = lut
+            return lut
+        
+        # Center of every quantization bin, in [0, 1]
+        levels = 1 << settings.LUT_BITS
+        step = 256 // levels
+        grid = (np.arange(levels, dtype=np.float32) * step + (step - 1) / 2) / 255
+        green_blue = np.stack(np.meshgrid(grid, grid, indexing="ij"), axis=-1).reshape(-1, 2)
+        params = self.get_grading_params(style_name)
+        
+        # One red level at a time, so the full table needs little scratch memory
+        rgba = np.zeros((levels, len(green_blue), 4), dtype=np.uint8)
+        for red in range(levels):
+            rgb = np.column_stack([np.full(len(green_blue), grid[red], dtype=np.float32), green_blue])
+            graded = self.grade_colors(rgb, params)
+            rgba[red, :, :3] = np.clip(np.rint((rgb + strength * (graded - rgb)) * 255), 0, 255)
+        lut = rgba.view(np.uint32).ravel()
+        
+        self.luts[key] = lut
+        while len(self.luts) > max(1, settings.LUT_CACHE_SIZE):
+            del self.luts[next(iter(self.luts))]
+        return lut
+    
+    def apply_lut(self, frame: np.ndarray, lut: np.ndarray) -> np.ndarray:
+        """Grade an RGB uint8 frame with a LUT from compile_lut."""
+        bits = int(round(np.log2(len(lut)) / 3))
+        shift = 8 - bits
+        quantized = frame >> shift if shift else frame
+        index = quantized[..., 0].astype(np.int32) << (2 * bits)
+        index |= quantized[..., 1].astype(np.int32) << bits
+        index |= quantized[..., 2]
+        
+        graded = np.take(lut, index).view(np.uint8).reshape(frame.shape[:2] + (4,))
+        return cv2.cvtColor(graded, cv2.COLOR_RGBA2RGB)
+    
+    def get_grading_params(self, style_name: str) -> Dict:
+        """Merge the built-in preset with the configured COLOR_GRADING_PRESETS entry."""
+        params = dict(self._get_style_params(style_name))
+        params.update(settings.COLOR_GRADING_PRESETS.get(style_name, {}))
+        return params
+    
+    def grade_colors(self, rgb: np.ndarray, params: Dict) -> np.ndarray:
+        """Apply a grading preset to float RGB values in [0, 1], shape (..., 3)."""
+        rgb = rgb.astype(np.float32, copy=True)
+        
+        # Color temperature: warm styles push red up and blue down
+        temperature = params.get("color_temperature", 0.0)
+        rgb[..., 0] *= 1 + temperature
+        rgb[..., 2] *= 1 - temperature
+        
+        # Brightness, then contrast around mid-grey
+        rgb *= params.get("brightness", 1.0)
+        rgb = (rgb - 0.5) * params.get("contrast", 1.0) + 0.5
+        
+        # Shadows and highlights, weighted by luma
+        luma = np.clip(rgb @ self.LUMA_WEIGHTS, 0, 1)[..., None]
+        rgb *= (1 + (params.get("shadows", 1.0) - 1) * (1 - luma) ** 2 +
+                (params.get("highlights", 1.0) - 1) * luma ** 2)
+        
+        # Saturation around the pixel's luma
+        luma = (rgb @ self.LUMA_WEIGHTS)[..., None]
+        rgb = luma + (rgb - luma) * params.get("saturation", 1.0)
+        
+        return np.clip(rgb, 0, 1)
     
     def _get_style_params(self, style_name: str) -> Dict:
         """Get predefined style parameters."""
@@ -131,8 +299,21 @@ class StyleTransfer:
         # Implement contrast and brightness adjustments
         return features * params["contrast"] + params["brightness"]
     
-    def _reconstruct_image(self, features: Dict[str, torch.Tensor]) -> torch.Tensor:
-        """Reconstruct the image from features."""
-        # Implement image reconstruction logic
-        # This is a simplified version
-        return features["35"]  # Use the deepest layer features 
\ No newline at end of file
+    def _reconstruct_image(self, features: Dict[str, torch.Tensor], init: torch.Tensor) -> torch.Tensor:
+        """Reconstruct images whose VGG features and Gram matrices match the given features."""
+        target_grams = {name: self._gram_matrix(target) for name, target in features.items()}
+        image = init.clone().requires_grad_(True)
+        optimizer = torch.optim.Adam([image], lr=self.LEARNING_RATE)
+        
+        for _ in range(settings.NEURAL_STYLE_STEPS):
+            optimizer.zero_grad()
+            current = self._get_features(image, self.model)
+            loss = sum(
+                F.mse_loss(current[name], target) +
+                self.STYLE_WEIGHT * F.mse_loss(self._gram_matrix(current[name]), target_grams[name])
+                for name, target in features.items()
+            )
+            loss.backward()
+            optimizer.step()
+        
+        return image.detach()
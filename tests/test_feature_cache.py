@@ -0,0 +1,36 @@
+import numpy as np
+import pytest
+from app.core.feature_cache import FeatureCache
+
+@pytest.fixture
+def cache(tmp_path):
+    return FeatureCache(cache_dir=tmp_path / "features", max_bytes=1024 * 1024)
+
+def test_features_round_trip(cache):
+    features = [np.full(2048, i, dtype=np.float32) for i in range(3)]
+    cache.save_features("abc", "resnet", [0.0, 1.0, 2.0001], features)
+    loaded = cache.load_features("abc", "resnet")
+    assert sorted(loaded) == [0.0, 1.0, 2.0]
+    assert loaded[1.0][0] == 1.0
+    assert cache.load_features("abc", "other-version") == {}
+
+def test_detections_round_trip(cache):
+    detections = {
+        0.0: [{"bbox": (1, 2, 3, 4), "confidence": 0.9, "class_id": 7}],
+        0.033: []
+    }
+    cache.save_detections("abc", "yolo", detections)
+    assert cache.load_detections("abc", "yolo") == detections
+
+def test_evicts_least_recently_used(tmp_path):
+    cache = FeatureCache(cache_dir=tmp_path / "features", max_bytes=12000)
+    features = [np.zeros(2048, dtype=np.float32)]
+    cache.save_features("old", "resnet", [0.0], features)
+    cache.save_features("new", "resnet", [0.0], features)
+    assert cache.load_features("old", "resnet") == {}
+    assert len(cache.load_features("new", "resnet")) == 1
+
+def test_disabled_without_cache_dir(cache):
+    cache.cache_dir = None
+    assert not cache.enabled
+    assert cache.load_features("abc", "resnet") == {}
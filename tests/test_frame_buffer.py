@@ -0,0 +1,26 @@
+import numpy as np
+import pytest
+from app.core.frame_buffer import FrameSampleBuffer
+
+def make_frame(value):
+    return np.full((4, 6, 3), value, dtype=np.uint8)
+
+def test_sample_buffer_rejects_small_capacity():
+    with pytest.raises(ValueError):
+        FrameSampleBuffer(1)
+
+def test_sample_buffer_spans_the_whole_scene():
+    buffer = FrameSampleBuffer(4)
+    for value in range(3):
+        buffer.append(make_frame(value))
+    assert [int(frame[0, 0, 0]) for frame in buffer] == [0, 1, 2]
+    
+    for value in range(3, 100):
+        buffer.append(make_frame(value))
+    # Evenly spaced from the first frame, not just the most recent ones
+    assert buffer.stride == 32
+    assert [int(frame[0, 0, 0]) for frame in buffer] == [0, 32, 64, 96]
+    
+    buffer.clear()
+    buffer.append(make_frame(7))
+    assert [int(frame[0, 0, 0]) for frame in buffer] == [7] and buffer.stride == 1
@@ -0,0 +1,119 @@
+import pytest
+from app.core.job_queue import JobQueue
+
+fakeredis = pytest.importorskip("fakeredis")
+pytest.importorskip("lupa")  # fakeredis needs it to run the job update script
+
+@pytest.fixture
+def job_queue():
+    queue = JobQueue()
+    queue.redis_client = fakeredis.FakeRedis(decode_responses=True)
+    return queue
+
+def test_dequeued_job_stays_on_worker_list_until_acked(job_queue):
+    job_id = job_queue.create_job("video.mp4", {})
+    assert job_queue.get_next_job("worker-a", timeout=1) == job_id
+    assert job_queue.start_job(job_id, "worker-a")["status"] == "processing"
+    assert job_queue.redis_client.lrange(f"{job_queue.worker_queue_prefix}worker-a", 0, -1) == [job_id]
+    
+    job_queue.ack_job(job_id, "worker-a")
+    assert job_queue.redis_client.llen(f"{job_queue.worker_queue_prefix}worker-a") == 0
+    # Nothing is left for the reaper
+    assert job_queue.requeue_stalled_jobs(visibility_timeout=0) == []
+
+def test_jobs_of_workers_that_died_right_after_dequeue_are_requeued(job_queue):
+    job_id = job_queue.create_job("video.mp4", {})
+    # The worker dies before it starts the job or sends a heartbeat
+    assert job_queue.get_next_job("worker-a", timeout=1) == job_id
+    assert job_queue.redis_client.hget(job_queue.job_workers_key, job_id) == "worker-a"
+    assert job_queue.requeue_stalled_jobs(visibility_timeout=0) == [job_id]
+    assert job_queue.redis_client.llen(f"{job_queue.worker_queue_prefix}worker-a") == 0
+    
+    # A job left on a processing list without an owner entry is still recovered
+    assert job_queue.get_next_job("worker-b", timeout=1) == job_id
+    job_queue.redis_client.hdel(job_queue.job_workers_key, job_id)
+    job_queue.redis_client.zrem(job_queue.heartbeats_key, job_id)
+    assert job_queue.requeue_stalled_jobs(visibility_timeout=0) == [job_id]
+    assert job_queue.get_next_job("worker-c", timeout=1) == job_id
+
+def test_stalled_jobs_are_requeued_then_failed(job_queue, monkeypatch):
+    monkeypatch.setattr("app.core.job_queue.settings.JOB_MAX_ATTEMPTS", 2)
+    job_id = job_queue.create_job("video.mp4", {})
+    
+    for attempt in range(2):
+        assert job_queue.get_next_job(f"worker-{attempt}", timeout=1) == job_id
+        job_queue.start_job(job_id, f"worker-{attempt}")
+        # A live heartbeat keeps the job with its worker
+        assert job_queue.requeue_stalled_jobs(visibility_timeout=60) == []
+        requeued = job_queue.requeue_stalled_jobs(visibility_timeout=0)
+        assert requeued == ([job_id] if attempt == 0 else [])
+        if requeued:
+            assert job_queue.get_job_status(job_id)["status"] == "pending"
+    
+    assert job_queue.get_job_status(job_id)["status"] == "failed"
+    assert job_queue.redis_client.zcard(f"{job_queue.lane_prefix}short") == 0
+
+def test_job_updates_are_field_level(job_queue):
+    job_id = job_queue.create_job("video.mp4", {"style": "cinematic"})
+    job_queue.update_job_progress(job_id, 30, "detecting_scenes", {"scenes": 4})
+    job_queue.complete_job(job_id, {"output_path": "out.mp4"})
+    
+    job = job_queue.get_job_status(job_id)
+    assert job["status"] == "completed" and job["progress"] == 100.0
+    assert job["params"] == {"style": "cinematic"} and job["details"] == {"scenes": 4}
+    assert job_queue.get_job_result(job_id) == {"output_path": "out.mp4"}
+    
+    # Updates for an expired job do not recreate a partial one
+    job_queue.redis_client.delete(f"{job_queue.job_status_prefix}{job_id}")
+    job_queue.update_job_progress(job_id, 50, "exporting_video")
+    assert job_queue.get_job_status(job_id) is None
+
+def test_status_indexes_follow_job_state(job_queue, monkeypatch):
+    done = job_queue.create_job("done.mp4", {})
+    pending = job_queue.create_job("pending.mp4", {})
+    job_queue.get_next_job("worker-a", timeout=1)
+    job_queue.start_job(done, "worker-a")
+    assert {job["id"] for job in job_queue.get_active_jobs()} == {done, pending}
+    
+    job_queue.complete_job(done, {})
+    assert [job["id"] for job in job_queue.get_active_jobs()] == [pending]
+    assert job_queue.redis_client.smembers(f"{job_queue.status_index_prefix}completed") == {done}
+    
+    # Listing never scans the keyspace
+    monkeypatch.setattr(job_queue.redis_client, "keys", None)
+    assert job_queue.cleanup_old_jobs(max_age_hours=1) == 0
+    assert job_queue.cleanup_old_jobs(max_age_hours=-1, batch_size=1) == 1
+    assert job_queue.get_job_status(done) is None
+    assert job_queue.redis_client.zcard(job_queue.completed_index) == 0
+
+def test_lanes_are_served_by_weight_and_cost(job_queue, monkeypatch):
+    monkeypatch.setattr("app.core.job_queue.settings.JOB_LANE_WEIGHTS", {"analysis": 2, "long": 1})
+    # Unprobeable videos count as JOB_DEFAULT_DURATION long
+    monkeypatch.setattr("app.core.job_queue.settings.JOB_SHORT_VIDEO_SECONDS", 30.0)
+    renders = [job_queue.create_job("render.mp4", {}) for _ in range(3)]
+    analyses = [job_queue.create_job("clip.mp4", {"analysis_only": True}) for _ in range(3)]
+    assert job_queue.get_job_status(analyses[0])["cost"] < job_queue.get_job_status(renders[0])["cost"]
+    
+    order = [job_queue.get_next_job("worker-a", timeout=0) for _ in range(6)]
+    assert order[:3] == [analyses[0], renders[0], analyses[1]]
+    assert sorted(order) == sorted(renders + analyses)
+    assert job_queue.get_next_job("worker-a", timeout=0) is None
+
+def test_tenant_penalty_lets_other_tenants_go_first(job_queue):
+    busy = [job_queue.create_job("video.mp4", {}, tenant_id="busy") for _ in range(3)]
+    other = job_queue.create_job("video.mp4", {}, tenant_id="other")
+    assert job_queue.get_next_job("worker-a", timeout=0) == busy[0]
+    assert job_queue.get_next_job("worker-a", timeout=0) == other
+
+def test_wake_ups_do_not_pile_up(job_queue):
+    for _ in range(200):
+        job_id = job_queue.create_job("video.mp4", {})
+        assert job_queue.get_next_job("worker-a", timeout=0) == job_id
+        job_queue.ack_job(job_id, "worker-a")
+    assert job_queue.redis_client.llen(job_queue.notify_key) == 0
+    
+    # Queued jobs keep one wake-up each
+    for _ in range(3):
+        job_queue.create_job("video.mp4", {})
+    job_queue.get_next_job("worker-a", timeout=0)
+    assert job_queue.redis_client.llen(job_queue.notify_key) == 2
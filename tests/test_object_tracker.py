@@ -0,0 +1,78 @@
+import numpy as np
+import pytest
+from app.core.config import settings
+from app.models.object_tracker import ObjectTracker, Track
+
+class StubTracker:
+    def __init__(self, succeed=True):
+        self.succeed = succeed
+        self.bbox = None
+
+    def init(self, frame, bbox):
+        self.bbox = bbox
+
+    def update(self, frame):
+        return self.succeed, self.bbox
+
+@pytest.fixture
+def object_tracker(monkeypatch):
+    # Skip loading YOLO and count detector calls instead
+    monkeypatch.setattr(settings, "DETECTION_INTERVAL", 3)
+    tracker = ObjectTracker.__new__(ObjectTracker)
+    tracker.tracker = StubTracker
+    tracker.reset()
+    tracker.detector_calls = 0
+
+    def detect_objects(frame, timestamp=None):
+        tracker.detector_calls += 1
+        return [{"bbox": (10, 10, 20, 20), "confidence": 0.9, "class_id": 0}]
+    tracker.detect_objects = detect_objects
+    return tracker
+
+def test_detector_runs_on_cadence(object_tracker):
+    frame = np.zeros((64, 64, 3), dtype=np.uint8)
+    assert object_tracker.scheduled_detections(7) == [True, False, False, True, False, False, True]
+    for _ in range(7):
+        track_info = object_tracker.update_tracks(frame)
+    assert object_tracker.detector_calls == 3
+    # Re-detections overlapping a live track do not start a new one
+    assert [info["track_id"] for info in track_info] == [0]
+
+def test_lost_track_triggers_redetection(object_tracker):
+    frame = np.zeros((64, 64, 3), dtype=np.uint8)
+    object_tracker.update_tracks(frame)
+    object_tracker.tracks[0].tracker.succeed = False
+    track_info = object_tracker.update_tracks(frame)
+    assert object_tracker.detector_calls == 2
+    # The object is found again where it was lost, so its track resumes
+    assert [info["track_id"] for info in track_info] == [0]
+    assert list(object_tracker.tracks) == [0]
+
+def test_lost_tracks_are_evicted(object_tracker, monkeypatch):
+    monkeypatch.setattr(settings, "TRACK_MAX_LOST_FRAMES", 2)
+    frame = np.zeros((64, 64, 3), dtype=np.uint8)
+    object_tracker.update_tracks(frame)
+    object_tracker.tracks[0].tracker.succeed = False
+    object_tracker.detect_objects = lambda frame, timestamp=None: []
+    for _ in range(2):
+        object_tracker.update_tracks(frame)
+    assert list(object_tracker.tracks) == [0]
+    object_tracker.update_tracks(frame)
+    assert object_tracker.tracks == {}
+
+def test_motion_patterns_use_aligned_histories(object_tracker, monkeypatch):
+    monkeypatch.setattr(settings, "TRACK_HISTORY_LENGTH", 4)
+    # Two objects moving right; the second one appears a frame later
+    tracks = object_tracker.tracks = {i: Track(i, settings.TRACK_HISTORY_LENGTH) for i in (0, 1)}
+    for frame_index in range(6):
+        object_tracker.frame_index = frame_index
+        object_tracker._record_position(tracks[0], (2 * frame_index, 0, 0, 0))
+        if frame_index > 0:
+            object_tracker._record_position(tracks[1], (2 * frame_index, 30, 0, 0))
+    object_tracker.frame_index = 6
+    track_info = [{"track_id": i} for i in (0, 1)]
+    
+    patterns = object_tracker.analyze_motion_patterns(track_info)
+    assert patterns["motion_complexity"] == pytest.approx(0.0)
+    assert patterns["motion_smoothness"] == pytest.approx(1.0)
+    assert patterns["object_interaction"] == pytest.approx(1 / (1 + 30 / 100))
@@ -0,0 +1,169 @@
+import re
+import subprocess
+import numpy as np
+import pytest
+from moviepy.config import get_setting
+from moviepy.editor import AudioClip, VideoClip, VideoFileClip
+from app.models.style_transfer import StyleTransfer
+from app.core.render import (concat_segments, covers_source, encoder_options, export_profile, extract_audio,
+                             fit_size, grade_clip, mux_audio, plan_smart_cut, probe_video, render_segment,
+                             rendition_path, smart_cut, split_timeline, write_renditions)
+
+def test_split_timeline_keeps_scene_boundaries():
+    segments = split_timeline([(0.0, 4.0), (8.0, 30.0)], max_duration=10.0, fps=25.0)
+    assert segments[0] == (0.0, 4.0)
+    # The long scene is split into near-equal parts on the frame grid that cover it exactly
+    assert [round((end - start) * 25) for start, end in segments[1:]] == [183, 184, 183]
+    assert segments[1][0] == 8.0 and segments[-1][1] == 30.0
+
+def test_segmented_render_keeps_every_frame_at_segment_bounds(tmp_path):
+    # Each frame shows its index in binary, one stripe per bit
+    fps = 30000 / 1001
+    def make_frame(t):
+        frame = np.zeros((32, 160, 3), dtype=np.uint8)
+        index = int(round(t * fps))
+        for bit in range(10):
+            if index >> bit & 1:
+                frame[:, bit * 16:(bit + 1) * 16] = 255
+        return frame
+    def frame_index(frame):
+        return sum(1 << bit for bit in range(10) if frame[:, bit * 16 + 4:(bit + 1) * 16 - 4].mean() > 127)
+    
+    source = str(tmp_path / "source.mp4")
+    VideoClip(make_frame, duration=8.0).write_videofile(source, fps=fps, logger=None)
+    
+    segments = split_timeline([(0.5, 3.3), (5.2, 7.9)], max_duration=0.7, fps=fps)
+    paths = []
+    for i, (start, end) in enumerate(segments):
+        paths.append(str(tmp_path / f"segment-{i}.mp4"))
+        render_segment({"video_path": source, "start": start, "end": end, "fps": fps, "style": None,
+                        "strength": 0.0, "profile": export_profile("mp4"), "output_path": paths[-1]})
+    output = str(tmp_path / "out.mp4")
+    concat_segments(paths, output, tmp_path)
+    
+    expected = list(range(15, 99)) + list(range(156, 237))
+    log = subprocess.run([get_setting("FFMPEG_BINARY"), "-i", output, "-map", "0:v", "-f", "null", "-"],
+                         capture_output=True, text=True).stderr
+    assert int(re.findall(r"frame=\s*(\d+)", log)[-1]) == len(expected)
+    clip = VideoFileClip(output)
+    assert [frame_index(clip.get_frame(i / fps)) for i in range(len(expected))] == expected
+    clip.close()
+
+def test_covers_source_detects_uncut_timelines():
+    # Scenes joined back to back leave the source as it is
+    assert covers_source([(0.0, 4.0), (4.0, 9.96)], duration=10.0, tolerance=0.05)
+    assert not covers_source([(0.0, 4.0), (6.0, 10.0)], duration=10.0, tolerance=0.05)
+    assert not covers_source([(0.0, 4.0)], duration=10.0, tolerance=0.05)
+    assert not covers_source([(4.0, 10.0), (0.0, 4.0)], duration=10.0, tolerance=0.05)
+
+def test_plan_smart_cut_copies_whole_gops():
+    keyframes = [0.0, 2.0, 4.0, 6.0]
+    assert plan_smart_cut(1.0, 5.0, keyframes, duration=8.0) == [
+        (1.0, 2.0, False), (2.0, 4.0, True), (4.0, 5.0, False)
+    ]
+    # Ranges running to the end of the video are copied up to the end
+    assert plan_smart_cut(4.0, 8.0, keyframes, duration=8.0) == [(4.0, 8.0, True)]
+    # Without a whole GOP inside, the range is re-encoded
+    assert plan_smart_cut(2.5, 3.5, keyframes, duration=8.0) == [(2.5, 3.5, False)]
+
+def test_smart_cut_keeps_every_frame_at_the_cut_points(tmp_path):
+    # Each frame shows its index in binary, one stripe per bit
+    def make_frame(t):
+        frame = np.zeros((32, 128, 3), dtype=np.uint8)
+        index = int(round(t * 25))
+        for bit in range(8):
+            if index >> bit & 1:
+                frame[:, bit * 16:(bit + 1) * 16] = 255
+        return frame
+    def frame_index(frame):
+        return sum(1 << bit for bit in range(8) if frame[:, bit * 16 + 4:(bit + 1) * 16 - 4].mean() > 127)
+    
+    source = str(tmp_path / "source.mp4")
+    tone = AudioClip(lambda t: np.sin(440 * 2 * np.pi * t), duration=10.0, fps=22050)
+    VideoClip(make_frame, duration=10.0).set_audio(tone).write_videofile(
+        source, fps=25, audio_codec="aac", logger=None,
+        ffmpeg_params=["-g", "25", "-keyint_min", "25", "-sc_threshold", "0"]
+    )
+    output = str(tmp_path / "out.mp4")
+    smart_cut(source, [(0.5, 3.3), (5.2, 8.7)], output, tmp_path, duration=10.0, fps=25.0)
+    
+    clip = VideoFileClip(output)
+    # Re-encoded GOP edges neither repeat their first frame nor drop their last
+    assert [frame_index(frame) for frame in clip.iter_frames()] == list(range(13, 83)) + list(range(130, 218))
+    assert clip.audio is not None
+    clip.close()
+
+def test_encoder_options_follow_export_format():
+    options = encoder_options(export_profile("tiktok"))
+    assert options["fps"] == 30 and options["preset"] == "fast"
+    params = options["ffmpeg_params"]
+    assert params[params.index("-crf") + 1] == "23"
+    assert params[params.index("-bufsize") + 1] == "8000k"
+    assert params[params.index("-vf") + 1].startswith("scale=1080:1920:force_original_aspect_ratio=decrease")
+    # Unknown formats keep the source size and frame rate
+    options = encoder_options(export_profile("mp4"))
+    assert "fps" not in options and "-vf" not in options["ffmpeg_params"]
+
+def test_fit_size_keeps_aspect_ratio_without_upscaling():
+    assert fit_size((1920, 1080), (1080, 1920)) == (1080, 606)
+    assert fit_size((320, 240), (1920, 1080)) == (320, 240)
+
+def test_write_renditions_decodes_each_frame_once(tmp_path):
+    decoded = []
+    def make_frame(t):
+        decoded.append(t)
+        return np.full((64, 96, 3), int(t * 50), dtype=np.uint8)
+    clip = VideoClip(make_frame, duration=2.0).set_fps(10)
+    
+    source = export_profile("mp4")
+    small = dict(source, resolution="48x48", fps=5)
+    renditions = [(rendition_path(str(tmp_path / "out.mp4"), name), profile)
+                  for name, profile in (("source", source), ("small", small))]
+    assert renditions[0][0] == str(tmp_path / "out.source.mp4")
+    
+    decoded.clear()
+    written = write_renditions(clip, renditions, tmp_path)
+    assert len(decoded) == 20
+    # The lower frame rate output takes every other decoded frame
+    assert written == [20, 10]
+    output = VideoFileClip(renditions[1][0])
+    assert tuple(output.size) == (48, 48) and output.fps == 5
+    output.close()
+
+def test_source_audio_is_muxed_without_reencoding(tmp_path):
+    clip = VideoClip(lambda t: np.zeros((32, 32, 3), dtype=np.uint8), duration=1.0).set_fps(10)
+    tone = AudioClip(lambda t: np.sin(440 * 2 * np.pi * t), duration=1.0, fps=22050)
+    clip.set_audio(tone).write_videofile(str(tmp_path / "source.mp4"), audio_codec="aac", audio_fps=22050,
+                                         audio_bitrate="48k", logger=None)
+    clip.write_videofile(str(tmp_path / "video.mp4"), audio=False, logger=None)
+    
+    extract_audio(str(tmp_path / "source.mp4"), str(tmp_path / "audio.mp4"))
+    mux_audio(str(tmp_path / "video.mp4"), str(tmp_path / "audio.mp4"), str(tmp_path / "out.mp4"))
+    probe = probe_video(str(tmp_path / "out.mp4"))
+    assert probe["video_codec"] == "h264" and probe["audio_codec"] == "aac"
+    # The copied track keeps the source's sample rate instead of being resampled
+    log = subprocess.run([get_setting("FFMPEG_BINARY"), "-hide_banner", "-i", str(tmp_path / "out.mp4")],
+                         capture_output=True, text=True).stderr
+    assert "22050 Hz" in log
+
+@pytest.mark.parametrize("mode", ["lut", "neural"])
+def test_graded_clip_follows_small_changes(mode, monkeypatch):
+    monkeypatch.setattr("app.core.render.settings.STYLE_MODE", mode)
+    style_transfer = StyleTransfer()
+    # A stand-in for the VGG pass, so only the reuse logic and the guided filter run
+    monkeypatch.setattr(style_transfer, "_style_small",
+                        lambda frames, params, strength: np.clip(frames / 255 * 0.9 + 0.05, 0, 1).astype(np.float32))
+    # A small region flips between dark and bright on every frame, like a blinking cursor
+    def make_frame(t):
+        frame = np.full((180, 320, 3), 90, dtype=np.uint8)
+        frame[60:70, 100:116] = 240 if int(round(t * 10)) % 2 else 20
+        return frame
+    clip, style_cache = grade_clip(VideoClip(make_frame, duration=2.0).set_fps(10), style_transfer, "cinematic", 0.8)
+    
+    regions = [frame[60:70, 100:116].mean() for frame in clip.iter_frames()]
+    assert all(bright > dark + 100 for dark, bright in zip(regions[::2], regions[1::2]))
+    if mode == "neural":
+        # The style transform is still reused across the nearly identical frames
+        assert style_cache.hits > 0
+    else:
+        assert style_cache is None
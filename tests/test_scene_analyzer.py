@@ -0,0 +1,64 @@
+import numpy as np
+import pytest
+from app.models.scene_analyzer import SceneAnalyzer
+
+@pytest.fixture
+def scene_analyzer():
+    # The boundary helpers only work on features, so skip loading the models
+    return SceneAnalyzer.__new__(SceneAnalyzer)
+
+def make_features(scene_lengths, dim=16, seed=0):
+    rng = np.random.default_rng(seed)
+    rows = []
+    for length in scene_lengths:
+        center = rng.normal(size=dim)
+        rows.extend(center + 0.01 * rng.normal(size=dim) for _ in range(length))
+    return np.asarray(rows, dtype=np.float32)
+
+def test_detect_boundaries_finds_scene_starts(scene_analyzer):
+    features = make_features([5, 3, 4])
+    boundaries = scene_analyzer.detect_boundaries(features, threshold=0.5)
+    assert boundaries.tolist() == [5, 8]
+    assert scene_analyzer.boundaries_to_intervals(boundaries, len(features)) == [(0, 5), (5, 8), (8, 12)]
+
+def test_consecutive_similarities_matches_pairwise(scene_analyzer):
+    features = make_features([4, 4])
+    expected = [scene_analyzer.feature_similarity(a, b) for a, b in zip(features[:-1], features[1:])]
+    np.testing.assert_allclose(scene_analyzer.consecutive_similarities(features), expected, rtol=1e-5)
+
+def test_adaptive_threshold_is_causal(scene_analyzer):
+    similarities = np.concatenate([np.full(40, 0.99), [0.8], np.full(10, 0.99)]).astype(np.float32)
+    thresholds = scene_analyzer.boundary_thresholds(similarities, 0.5, adaptive=True)
+    assert thresholds[40] > 0.8
+    # Evaluating a prefix gives the same thresholds as the full sequence
+    np.testing.assert_allclose(scene_analyzer.boundary_thresholds(similarities[:41], 0.5, adaptive=True),
+                               thresholds[:41])
+    assert (scene_analyzer.boundary_thresholds(similarities, 0.5) == 0.5).all()
+
+def test_signature_distances_flag_cuts_only(scene_analyzer):
+    red = np.zeros((72, 128, 3), dtype=np.uint8)
+    red[..., 2] = 200
+    blue = np.zeros_like(red)
+    blue[..., 0] = 200
+    signatures = [scene_analyzer.frame_signature(frame) for frame in (red, red.copy(), blue)]
+    distances = scene_analyzer.signature_distances(signatures)
+    assert distances[0] == pytest.approx(0.0)
+    assert distances[1] > 0.5
+
+def test_select_keyframes_picks_one_sample_per_scene(scene_analyzer):
+    features = make_features([6, 6, 6])
+    keyframes = scene_analyzer.select_keyframes(features, num_keyframes=3)
+    assert len(keyframes) == 3
+    assert sorted(k // 6 for k in keyframes) == [0, 1, 2]
+
+def test_select_keyframes_with_repeated_embeddings(scene_analyzer):
+    features = np.repeat(make_features([1, 1]), 5, axis=0)
+    assert scene_analyzer.select_keyframes(features, num_keyframes=5) == [0, 5]
+
+def test_continuity_reuses_motion_data(scene_analyzer):
+    # No tracker is loaded, so this fails if the frames were tracked again
+    motion_data = [{"magnitude": 0.1, "direction": 0.5, "variance": 0.2, "num_objects": 2}] * 3
+    continuity = scene_analyzer.analyze_scene_continuity(motion_data=motion_data)
+    assert continuity["motion_consistency"] == pytest.approx(1.0)
+    assert continuity["object_continuity"] == pytest.approx(1.0)
+    assert continuity["continuity_score"] == pytest.approx(0.4 + 0.3 + 0.8 * 0.3)
@@ -0,0 +1,24 @@
+import numpy as np
+from app.core.style_cache import TemporalStyleCache
+
+def make_frame(value):
+    return np.full((36, 64, 3), value, dtype=np.uint8)
+
+def test_nearly_identical_frames_reuse_transform():
+    cache = TemporalStyleCache(threshold=0.01)
+    calls = []
+    def style_transform(frame):
+        calls.append(frame)
+        return object()
+
+    transforms = [cache.lookup(make_frame(value), style_transform) for value in (100, 101, 100, 200)]
+    assert len(calls) == 2
+    assert transforms[1] is transforms[0] and transforms[2] is transforms[0]
+    assert transforms[3] is not transforms[0]
+    assert cache.stats() == {"hits": 2, "misses": 2, "hit_rate": 0.5}
+
+def test_drift_is_measured_against_the_styled_frame():
+    cache = TemporalStyleCache(threshold=0.01)
+    # Each frame is close to the previous one, but not to the last styled frame
+    hits = [cache.matches(make_frame(value)) for value in (100, 102, 104, 106)]
+    assert hits == [False, True, False, True]
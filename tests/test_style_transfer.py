@@ -0,0 +1,58 @@
+import numpy as np
+import pytest
+from app.models.style_transfer import StyleTransfer
+
+@pytest.fixture
+def style_transfer():
+    return StyleTransfer()
+
+@pytest.fixture
+def frame():
+    return np.random.default_rng(0).integers(0, 256, (48, 64, 3), dtype=np.uint8)
+
+def test_lut_matches_direct_grading(style_transfer, frame):
+    lut = style_transfer.compile_lut("vibrant", 0.7)
+    colors = frame / 255
+    graded = style_transfer.grade_colors(colors, style_transfer.get_grading_params("vibrant"))
+    expected = np.rint((colors + 0.7 * (graded - colors)) * 255)
+    output = style_transfer.apply_lut(frame, lut)
+    assert output.shape == frame.shape and output.dtype == np.uint8
+    # Every color has its own entry, so only float rounding differs
+    assert np.abs(output - expected).max() <= 1
+
+def test_lut_does_not_band_gradients(style_transfer):
+    ramp = np.repeat(np.arange(256, dtype=np.uint8), 3).reshape(1, 256, 3)
+    output = style_transfer.apply_lut(ramp, style_transfer.compile_lut("cinematic", 0.5)).astype(int)
+    colors = ramp / 255
+    graded = style_transfer.grade_colors(colors, style_transfer.get_grading_params("cinematic"))
+    expected = np.rint((colors + 0.5 * (graded - colors)) * 255)
+    # Neighbouring input levels stay as close as the direct grade keeps them
+    assert np.abs(np.diff(output, axis=1)).max() <= np.abs(np.diff(expected, axis=1)).max() + 1
+    assert np.abs(output - expected).max() <= 1
+
+def test_zero_strength_is_identity(style_transfer, frame):
+    output = style_transfer.apply_lut(frame, style_transfer.compile_lut("cinematic", 0.0))
+    assert np.abs(output.astype(int) - frame).max() <= 1
+
+def test_luts_are_compiled_once(style_transfer):
+    lut = style_transfer.compile_lut("muted", 0.5)
+    assert style_transfer.compile_lut("muted", 0.5) is lut
+    assert style_transfer._model is None
+
+def test_lut_cache_keeps_recent_luts(style_transfer):
+    from app.core.config import settings
+    muted = style_transfer.compile_lut("muted", 0.5)
+    for strength in (0.1, 0.2, 0.3):
+        style_transfer.compile_lut("cinematic", strength)
+        # The LUT in use is refreshed on every lookup, so it is never the one dropped
+        assert style_transfer.compile_lut("muted", 0.5) is muted
+    assert len(style_transfer.luts) == settings.LUT_CACHE_SIZE
+
+def test_guided_upsample_transfers_low_resolution_change(style_transfer, frame, monkeypatch):
+    from app.core.config import settings
+    monkeypatch.setattr(settings, "NEURAL_STYLE_TILE_ROWS", 16)
+    small = np.random.default_rng(1).uniform(0.1, 0.8, (12, 16, 3)).astype(np.float32)
+    # A uniform brightening at low resolution brightens the full frame the same way
+    output = style_transfer._guided_upsample(frame, small, small + 0.1)
+    assert output.shape == frame.shape
+    assert np.abs(output.astype(int) - np.clip(frame.astype(int) + 25.5, 0, 255)).mean() < 2
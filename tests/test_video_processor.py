@@ -1,7 +1,12 @@
+import numpy as np
 import pytest
 from pathlib import Path
+from moviepy.editor import VideoClip
+from app.core.feature_cache import FeatureCache
 from app.core.video_processor import VideoProcessor
 from app.core.config import settings
+from app.models.object_tracker import ObjectTracker
+from app.models.scene_analyzer import SceneAnalyzer
 
 @pytest.fixture
 def video_processor():
@@ -46,4 +51,123 @@ def test_cleanup(video_processor, sample_video_path):
     video_processor.load_video(sample_video_path)
     video_processor.cleanup()
     assert video_processor.current_video is None
-    assert len(video_processor.scenes) == 0 
\ No newline at end of file
+    assert len(video_processor.scenes) == 0 
+
+
+# Three 2 s shots in primary colors, each with a small box drifting slowly across it.
+# Halfway through the second shot a corner marker appears, which the stub model
+# sees as a cut but the pre-filter is too coarse to notice.
+SHOT_COLORS = [(220, 30, 30), (30, 220, 30), (30, 30, 220)]
+
+def make_shot_frame(t):
+    color = np.array(SHOT_COLORS[min(int(t // 2.0), 2)], dtype=np.uint8)
+    frame = np.empty((48, 64, 3), dtype=np.uint8)
+    frame[:] = color
+    x = int(t % 2.0 * 10)
+    frame[20:28, x:x + 8] = color // 2
+    if 3.0 <= t < 4.0:
+        frame[:4, :4] = 255
+    return frame
+
+def marker_scenes(prefilter):
+    # The marker only splits the second shot when every sample goes through the model
+    cuts = [0.0, 2.0, 4.0, 6.0] if prefilter else [0.0, 2.0, 3.0, 4.0, 6.0]
+    return [(pytest.approx(a), pytest.approx(b)) for a, b in zip(cuts[:-1], cuts[1:])]
+
+def shot_of(frame):
+    return int(np.argmax(frame.reshape(-1, 3).mean(axis=0)))
+
+@pytest.fixture
+def shots_path(tmp_path):
+    path = str(tmp_path / "shots.mp4")
+    VideoClip(make_shot_frame, duration=6.0).write_videofile(path, fps=10, logger=None)
+    return path
+
+@pytest.fixture
+def stub_processor(monkeypatch):
+    # Stub embedding model and detector, recording what each one is given
+    monkeypatch.setattr(settings, "SCENE_SAMPLE_RATE", 5.0)
+    monkeypatch.setattr(settings, "SCENE_ADAPTIVE_THRESHOLD", False)
+    calls = {"embedded": 0, "tracked": [[]], "analyzed": []}
+    
+    def extract_features_batch(frames, batch_size=None):
+        calls["embedded"] += len(frames)
+        # Mean color around mid-gray, so shots are nearly orthogonal, plus the corner marker
+        return np.stack([
+            np.append(frame.reshape(-1, 3).mean(axis=0) - 128, 3 * (frame[:4, :4].mean() - 128))
+            for frame in frames
+        ]).astype(np.float32)
+    
+    def make_analyzer():
+        tracker = ObjectTracker.__new__(ObjectTracker)
+        tracker.model_version = "stub"
+        tracker.detection_cache = {}
+        tracker.reset()
+        def detect_objects_batch(frames, timestamps=None):
+            calls["tracked"][-1].extend(shot_of(frame) for frame in frames)
+            return [[] for _ in frames]
+        tracker.detect_objects_batch = detect_objects_batch
+        reset = tracker.reset
+        def reset_and_record():
+            reset()
+            calls["tracked"].append([])
+        tracker.reset = reset_and_record
+        
+        analyzer = SceneAnalyzer.__new__(SceneAnalyzer)
+        analyzer.model_version = "stub"
+        analyzer.object_tracker = tracker
+        analyzer.extract_features_batch = extract_features_batch
+        analyze_scene_quality = analyzer.analyze_scene_quality
+        def record_scene_quality(frames):
+            calls["analyzed"].append([shot_of(frame) for frame in frames])
+            return analyze_scene_quality(frames)
+        analyzer.analyze_scene_quality = record_scene_quality
+        return analyzer
+    monkeypatch.setattr("app.core.video_processor.SceneAnalyzer", make_analyzer)
+    
+    def make_processor(cache_dir, video_path):
+        processor = VideoProcessor()
+        processor.feature_cache = FeatureCache(cache_dir=cache_dir)
+        processor.load_video(video_path)
+        return processor
+    return make_processor, calls
+
+@pytest.mark.parametrize("prefilter", [True, False])
+def test_detect_scenes_with_stub_models(stub_processor, shots_path, tmp_path, monkeypatch, prefilter):
+    make_processor, calls = stub_processor
+    monkeypatch.setattr(settings, "SCENE_PREFILTER", prefilter)
+    
+    processor = make_processor(tmp_path / "cache", shots_path)
+    scenes = processor.detect_scenes()
+    assert scenes == marker_scenes(prefilter)
+    # With the pre-filter only the first sample and the two sides of each cut are embedded
+    assert calls["embedded"] == (5 if prefilter else 30)
+    # Each scene's sampled frames and tracked frames come from that scene alone
+    shots = [{0}, {1}, {2}] if prefilter else [{0}, {1}, {1}, {2}]
+    assert [set(s) for s in calls["analyzed"]] == shots
+    assert [set(s) for s in calls["tracked"] if s] == shots
+    processor.cleanup()
+    
+    # A second run reads every embedding it needs from the cache and cuts in the same places
+    calls["embedded"] = 0
+    processor = make_processor(tmp_path / "cache", shots_path)
+    assert processor.detect_scenes() == scenes
+    assert calls["embedded"] == 0
+    processor.cleanup()
+    
+    # The cache only holds real embeddings, never estimated ones, so the other mode can use it too
+    monkeypatch.setattr(settings, "SCENE_PREFILTER", not prefilter)
+    processor = make_processor(tmp_path / "cache", shots_path)
+    assert processor.detect_scenes() == marker_scenes(not prefilter)
+    processor.cleanup()
+    monkeypatch.setattr(settings, "SCENE_PREFILTER", prefilter)
+    
+    # Scenes are also the same on a cache filled with every sample by an earlier keyframe job
+    processor = make_processor(tmp_path / "keyframe-cache", shots_path)
+    processor.get_keyframes()
+    processor.cleanup()
+    calls["embedded"] = 0
+    processor = make_processor(tmp_path / "keyframe-cache", shots_path)
+    assert processor.detect_scenes() == scenes
+    assert calls["embedded"] == 0
+    processor.cleanup()